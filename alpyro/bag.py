@@ -0,0 +1,501 @@
+import bz2
+import mmap
+import time
+from asyncio import sleep
+from base64 import b64encode
+from functools import partial
+from importlib import import_module
+from struct import Struct
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+from alpyro_msgs import RosMessage, Time
+
+try:
+    import lz4.frame as lz4
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+_VERSION = b"#ROSBAG V2.0\n"
+# the bag header record is padded to this size, so that it can be rewritten when the bag is closed
+_BAG_HEADER_SIZE = 4096
+
+OP_MSG_DATA = 0x02
+OP_BAG_HEADER = 0x03
+OP_INDEX_DATA = 0x04
+OP_CHUNK = 0x05
+OP_CHUNK_INFO = 0x06
+OP_CONNECTION = 0x07
+
+_UINT32 = Struct("<I")
+_UINT64 = Struct("<Q")
+_TIME = Struct("<II")
+# time and offset of a message record in the uncompressed chunk
+_INDEX_ENTRY = Struct("<III")
+# connection and number of its messages in a chunk
+_CHUNK_COUNT = Struct("<II")
+
+# fields of the connection header which are stored in the bag
+_CONNECTION_FIELDS = ("topic", "type", "md5sum", "message_definition", "callerid", "latching")
+
+
+class Connection(NamedTuple):
+    id: int
+    topic: str
+    header: Dict[str, str]
+
+
+class ChunkInfo(NamedTuple):
+    pos: int
+    start: int
+    end: int
+    # number of messages of each connection in the chunk
+    counts: Dict[int, int]
+
+
+class BagMessage(NamedTuple):
+    connection: Connection
+    time: Time
+    data: memoryview
+
+
+def _pack_time(t: int) -> bytes:
+    return _TIME.pack(*divmod(t, 1_000_000_000))
+
+
+def _unpack_time(data: bytes) -> int:
+    secs, nsecs = _TIME.unpack(data)
+    return secs * 1_000_000_000 + nsecs
+
+
+def _encode_header(fields: Dict[str, bytes]) -> bytes:
+    b = bytearray()
+    for name, val in fields.items():
+        field = name.encode("utf-8") + b"=" + val
+        b += _UINT32.pack(len(field))
+        b += field
+    return bytes(b)
+
+
+def _decode_header(buffer: Any) -> Dict[str, bytes]:
+    fields = {}
+    cur = 0
+    while cur < len(buffer):
+        l, = _UINT32.unpack_from(buffer, cur)
+        name, _, val = bytes(buffer[cur + 4 : cur + 4 + l]).partition(b"=")
+        fields[name.decode("utf-8")] = val
+        cur += 4 + l
+    return fields
+
+
+def _record(fields: Dict[str, bytes], data: Any) -> bytes:
+    header = _encode_header(fields)
+    return _UINT32.pack(len(header)) + header + _UINT32.pack(len(data)) + data
+
+
+def _read_record(buffer: Any, pos: int) -> Tuple[Dict[str, bytes], memoryview, int]:
+    """header and data of the record at pos and the position of the next record"""
+    l, = _UINT32.unpack_from(buffer, pos)
+    header = _decode_header(buffer[pos + 4 : pos + 4 + l])
+    pos += 4 + l
+    l, = _UINT32.unpack_from(buffer, pos)
+    return header, buffer[pos + 4 : pos + 4 + l], pos + 4 + l
+
+
+def _compress(compression: str, data: bytes) -> bytes:
+    if compression == "bz2":
+        return bz2.compress(data)
+    if compression == "lz4":
+        return lz4.compress(data)
+    return data
+
+
+def _decompress(compression: str, data: memoryview) -> memoryview:
+    if compression == "bz2":
+        return memoryview(bz2.decompress(data))
+    if compression == "lz4":
+        return memoryview(lz4.decompress(data))
+    return data
+
+
+class BagWriter:
+    """Writes serialized messages into a ROS bag (version 2.0) file.
+
+    The messages are collected in chunks, which are compressed and followed by their index when they are full.
+    The connection and chunk info records are written when the bag is closed.
+    """
+    connections: List[Connection]
+    chunk_infos: List[ChunkInfo]
+    closed: bool = False
+
+    def __init__(self, path: str, compression: str = "none", chunk_size: int = 768 * 1024) -> None:
+        assert compression in ("none", "bz2", "lz4")
+        if compression == "lz4" and lz4 is None:
+            raise ImportError("lz4 compression needs the lz4 package")
+
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.connections = []
+        self.chunk_infos = []
+
+        self.chunk = bytearray()
+        # time and offset of the messages in the current chunk by connection
+        self.chunk_index: Dict[int, List[Tuple[int, int]]] = {}
+        self.chunk_start = 0
+        self.chunk_end = 0
+        # connections whose record is already in the current chunk
+        self.chunk_connections: Dict[int, bool] = {}
+
+        self.file = open(path, "wb")
+        self.file.write(_VERSION)
+        self._write_bag_header(0)
+
+    def _write_bag_header(self, index_pos: int) -> None:
+        header = _encode_header({
+            "op": bytes((OP_BAG_HEADER,)),
+            "index_pos": _UINT64.pack(index_pos),
+            "conn_count": _UINT32.pack(len(self.connections)),
+            "chunk_count": _UINT32.pack(len(self.chunk_infos)),
+        })
+        padding = _BAG_HEADER_SIZE - 8 - len(header)
+        self.file.write(_UINT32.pack(len(header)) + header + _UINT32.pack(padding) + b" " * padding)
+
+    def _connection_record(self, conn: Connection) -> bytes:
+        header = {name: conn.header[name] for name in _CONNECTION_FIELDS if name in conn.header}
+        header["topic"] = conn.topic
+        data = _encode_header({name: val.encode("utf-8") for name, val in header.items()})
+        return _record({
+            "op": bytes((OP_CONNECTION,)),
+            "topic": conn.topic.encode("utf-8"),
+            "conn": _UINT32.pack(conn.id),
+        }, data)
+
+    def add_connection(self, topic: str, header: Dict[str, str]) -> int:
+        """add a publisher of a topic with its connection header, returns the id for write"""
+        conn = Connection(len(self.connections), topic, header)
+        self.connections.append(conn)
+        return conn.id
+
+    def write(self, conn: int, data: Any, t: Optional[int] = None) -> None:
+        """add a serialized message which was received at t (in nanoseconds, now by default)"""
+        if t is None:
+            t = time.time_ns()
+
+        if conn not in self.chunk_connections:
+            self.chunk_connections[conn] = True
+            self.chunk += self._connection_record(self.connections[conn])
+
+        if not self.chunk_index:
+            self.chunk_start = self.chunk_end = t
+        self.chunk_start = min(self.chunk_start, t)
+        self.chunk_end = max(self.chunk_end, t)
+        self.chunk_index.setdefault(conn, []).append((t, len(self.chunk)))
+
+        header = _encode_header({
+            "op": bytes((OP_MSG_DATA,)),
+            "conn": _UINT32.pack(conn),
+            "time": _pack_time(t),
+        })
+        self.chunk += _UINT32.pack(len(header))
+        self.chunk += header
+        self.chunk += _UINT32.pack(len(data))
+        self.chunk += data
+
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """write the current chunk and its index"""
+        if not self.chunk_index:
+            return
+
+        pos = self.file.tell()
+        self.file.write(_record({
+            "op": bytes((OP_CHUNK,)),
+            "compression": self.compression.encode("utf-8"),
+            "size": _UINT32.pack(len(self.chunk)),
+        }, _compress(self.compression, self.chunk)))
+
+        for conn, entries in self.chunk_index.items():
+            data = b"".join(_INDEX_ENTRY.pack(*divmod(t, 1_000_000_000), offset) for t, offset in entries)
+            self.file.write(_record({
+                "op": bytes((OP_INDEX_DATA,)),
+                "ver": _UINT32.pack(1),
+                "conn": _UINT32.pack(conn),
+                "count": _UINT32.pack(len(entries)),
+            }, data))
+
+        counts = {conn: len(entries) for conn, entries in self.chunk_index.items()}
+        self.chunk_infos.append(ChunkInfo(pos, self.chunk_start, self.chunk_end, counts))
+
+        self.chunk = bytearray()
+        self.chunk_index = {}
+        self.chunk_connections = {}
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+
+        self.flush()
+        index_pos = self.file.tell()
+
+        for conn in self.connections:
+            self.file.write(self._connection_record(conn))
+
+        for info in self.chunk_infos:
+            self.file.write(_record({
+                "op": bytes((OP_CHUNK_INFO,)),
+                "ver": _UINT32.pack(1),
+                "chunk_pos": _UINT64.pack(info.pos),
+                "start_time": _pack_time(info.start),
+                "end_time": _pack_time(info.end),
+                "count": _UINT32.pack(len(info.counts)),
+            }, b"".join(_CHUNK_COUNT.pack(conn, count) for conn, count in info.counts.items())))
+
+        self.file.seek(len(_VERSION))
+        self._write_bag_header(index_pos)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class BagReader:
+    """Reads a ROS bag (version 2.0) file through a memory map.
+
+    Only the chunks which contain messages of the requested topics and time range are read, using the index at the end
+    of the bag. The messages of uncompressed bags are returned as views into the memory map without copying them.
+    """
+    connections: Dict[int, Connection]
+    chunk_infos: List[ChunkInfo]
+
+    def __init__(self, path: str) -> None:
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.map)
+        self._chunks: Dict[int, memoryview] = {}
+
+        if self.buffer[: len(_VERSION)] != _VERSION:
+            raise ValueError(f"{path} is not a ROS bag in version 2.0")
+
+        header, _, _ = _read_record(self.buffer, len(_VERSION))
+        index_pos, = _UINT64.unpack(header["index_pos"])
+        conn_count, = _UINT32.unpack(header["conn_count"])
+        chunk_count, = _UINT32.unpack(header["chunk_count"])
+        if index_pos == 0:
+            raise ValueError(f"{path} has no index, it was not closed properly")
+
+        self.connections = {}
+        pos = index_pos
+        for _ in range(conn_count):
+            header, data, pos = _read_record(self.buffer, pos)
+            conn, = _UINT32.unpack(header["conn"])
+            fields = {name: val.decode("utf-8") for name, val in _decode_header(data).items()}
+            self.connections[conn] = Connection(conn, header["topic"].decode("utf-8"), fields)
+
+        self.chunk_infos = []
+        for _ in range(chunk_count):
+            header, data, pos = _read_record(self.buffer, pos)
+            counts = dict(_CHUNK_COUNT.iter_unpack(data))
+            self.chunk_infos.append(ChunkInfo(
+                _UINT64.unpack(header["chunk_pos"])[0],
+                _unpack_time(header["start_time"]),
+                _unpack_time(header["end_time"]),
+                counts,
+            ))
+
+    @property
+    def start_time(self) -> int:
+        return min((c.start for c in self.chunk_infos), default=0)
+
+    @property
+    def end_time(self) -> int:
+        return max((c.end for c in self.chunk_infos), default=0)
+
+    def topics(self) -> Dict[str, str]:
+        """type of each topic in the bag"""
+        return {conn.topic: conn.header.get("type", "") for conn in self.connections.values()}
+
+    def _chunk(self, index: int) -> memoryview:
+        data = self._chunks.get(index)
+        if data is None:
+            # keep only a few decompressed chunks, messages are read in time order
+            if len(self._chunks) >= 4:
+                self._chunks.clear()
+            header, data, _ = _read_record(self.buffer, self.chunk_infos[index].pos)
+            data = self._chunks[index] = _decompress(header["compression"].decode("utf-8"), data)
+        return data
+
+    def messages(
+        self,
+        topics: Optional[Sequence[str]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Iterator[BagMessage]:
+        """messages of the given topics received between start and end (in seconds since the epoch) in time order"""
+        conns = {c.id for c in self.connections.values() if topics is None or c.topic in topics}
+        start_ns = 0 if start is None else int(start * 1e9)
+        end_ns = 2 ** 64 if end is None else int(end * 1e9)
+
+        entries: List[Tuple[int, int, int, int]] = []
+        for index, info in enumerate(self.chunk_infos):
+            if info.end < start_ns or info.start > end_ns or conns.isdisjoint(info.counts):
+                continue
+
+            # the index records follow their chunk
+            _, _, pos = _read_record(self.buffer, info.pos)
+            for _ in range(len(info.counts)):
+                header, data, pos = _read_record(self.buffer, pos)
+                conn, = _UINT32.unpack(header["conn"])
+                if conn not in conns:
+                    continue
+                for secs, nsecs, offset in _INDEX_ENTRY.iter_unpack(data):
+                    t = secs * 1_000_000_000 + nsecs
+                    if start_ns <= t <= end_ns:
+                        entries.append((t, index, offset, conn))
+
+        entries.sort()
+        for t, index, offset, conn in entries:
+            _, data, _ = _read_record(self._chunk(index), offset)
+            yield BagMessage(self.connections[conn], Time(*divmod(t, 1_000_000_000)), data)
+
+    def close(self) -> None:
+        self._chunks.clear()
+        self.buffer.release()
+        try:
+            self.map.close()
+        except BufferError:
+            # messages which are still referenced keep the map open
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+# message classes created for types from bags by (type, md5sum)
+_MESSAGE_TYPES: Dict[Tuple[str, str], Type[RosMessage]] = {}
+
+
+def message_type(header: Dict[str, str]) -> Type[RosMessage]:
+    """message class for a connection header, the one of alpyro_msgs if it exists"""
+    key = (header["type"], header["md5sum"])
+    typ = _MESSAGE_TYPES.get(key)
+    if typ is not None:
+        return typ
+
+    package, _, name = header["type"].partition("/")
+    try:
+        typ = getattr(import_module(f"alpyro_msgs.{package}.{name.lower()}"), name)
+    except (ImportError, AttributeError):
+        typ = None
+
+    if typ is None or typ.__md5_sum__ != header["md5sum"]:
+        # messages of unknown types can still be published serialized
+        typ = type(name, (RosMessage,), {
+            "__module__": __name__,
+            "__msg_typ__": header["type"],
+            "__md5_sum__": header["md5sum"],
+            "__msg_def__": b64encode(header.get("message_definition", "").encode("utf-8")).decode("utf-8"),
+        })
+
+    _MESSAGE_TYPES[key] = typ
+    return typ
+
+
+class Recorder:
+    """Records the serialized messages of topics into a bag"""
+
+    def __init__(self, node, path: str, topics: Sequence[str], compression: str = "none", chunk_size: int = 768 * 1024) -> None:
+        self.node = node
+        self.topics = topics
+        self.writer = BagWriter(path, compression, chunk_size)
+        # connection ids by topic and publisher
+        self.connections: Dict[Tuple[str, str], int] = {}
+
+    async def start_async(self) -> None:
+        for topic in self.topics:
+            await self.node.subscribe_raw_async(topic, partial(self._record, topic))
+
+    def start(self) -> None:
+        self.node._sync(self.start_async())
+
+    def _record(self, topic: str, data: memoryview, headers: Dict[str, str]) -> None:
+        if self.writer.closed:
+            return
+
+        key = (topic, headers.get("callerid", ""))
+        conn = self.connections.get(key)
+        if conn is None:
+            conn = self.connections[key] = self.writer.add_connection(topic, headers)
+        self.writer.write(conn, data)
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class Player:
+    """Publishes the messages of a bag with a node without decoding them.
+
+    With a rate of 0 the messages are published as fast as possible, otherwise with the time between them in the bag
+    divided by the rate.
+    """
+
+    def __init__(
+        self,
+        node,
+        path: str,
+        topics: Optional[Sequence[str]] = None,
+        rate: float = 1.0,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> None:
+        self.node = node
+        self.reader = BagReader(path)
+        self.topics = topics
+        self.rate = rate
+        self.start = start
+        self.end = end
+
+    async def play_async(self, wait_for_subscribers: bool = False) -> None:
+        topics = set()
+        for conn in self.reader.connections.values():
+            if self.topics is not None and conn.topic not in self.topics:
+                continue
+            topics.add(conn.topic)
+            if conn.topic not in self.node.pubs:
+                latch = conn.header.get("latching") == "1"
+                await self.node.announce_async(conn.topic, message_type(conn.header), latch=latch)
+
+        while wait_for_subscribers and not all(self.node.pubs[t] or self.node.local_subs[t] for t in topics):
+            await sleep(0.1)
+
+        loop = self.node.loop
+        bag_start: Optional[int] = None
+        wall_start = 0.0
+
+        for msg in self.reader.messages(self.topics, self.start, self.end):
+            if self.rate > 0:
+                t = msg.time.secs * 1_000_000_000 + msg.time.nsecs
+                if bag_start is None:
+                    bag_start = t
+                    wall_start = loop.time()
+                delay = wall_start + (t - bag_start) / 1e9 / self.rate - loop.time()
+                if delay > 0:
+                    await sleep(delay)
+            else:
+                # give the transports a chance to send
+                await sleep(0)
+
+            self.node.publish_serialized(msg.connection.topic, msg.data)
+
+    def play(self, wait_for_subscribers: bool = False) -> None:
+        self.node._sync(self.play_async(wait_for_subscribers))
+
+    def close(self) -> None:
+        self.reader.close()
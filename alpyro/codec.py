@@ -0,0 +1,558 @@
+import struct
+import sys
+from array import array
+from struct import Struct
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+from alpyro_msgs import Duration, RosMessage, Time
+from typing_extensions import Annotated, Final, get_type_hints
+from typing_extensions import get_args, get_origin  # type: ignore[attr-defined]
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+_UINT32 = Struct("<I")
+
+_INT_FORMATS = {
+    (1, False): "B",
+    (1, True): "b",
+    (2, False): "H",
+    (2, True): "h",
+    (4, False): "I",
+    (4, True): "i",
+    (8, False): "Q",
+    (8, True): "q",
+}
+_FLOAT_FORMATS = {4: "f", 8: "d"}
+# struct formats which can be decoded into a numpy or array.array view
+_ARRAY_FORMATS = "bBhHiIqQfd"
+
+_ENCODE_OP = Callable[[RosMessage, bytearray], None]
+_DECODE_OP = Callable[[RosMessage, Any, int], int]
+_ENCODE_VALUE = Callable[[Any, bytearray], None]
+_DECODE_VALUE = Callable[[Any, int], Tuple[Any, int]]
+
+
+def _primitive_format(typ: Any) -> Optional[str]:
+    """struct format of a fixed size primitive type, None for all other types"""
+    if get_origin(typ) is not Annotated:
+        return None
+
+    base, size, signed = get_args(typ)
+
+    if base is bool:
+        return "?"
+    if base is int:
+        return _INT_FORMATS[(size, signed)]
+    if base is float:
+        return _FLOAT_FORMATS[size]
+    if base is Time or base is Duration:
+        return "II"
+    return None
+
+
+def _default(typ: Any) -> Any:
+    if get_origin(typ) is Annotated and get_origin(get_args(typ)[0]) is list:
+        return []
+    return typ()
+
+
+def _value_codec(typ: Any, arrays: bool, views: bool) -> Tuple[_ENCODE_VALUE, _DECODE_VALUE]:
+    if get_origin(typ) is None and issubclass(typ, RosMessage):
+        return _message_codec(typ, arrays, views)
+
+    base, size, _ = get_args(typ)
+
+    if base is str:
+        return _string_codec()
+    if base is bytes:
+        return _bytes_codec(size, views)
+    if get_origin(base) is list:
+        elem, *_ = get_args(base)
+        return _list_codec(elem, size, arrays, views)
+
+    fmt = _primitive_format(typ)
+    assert fmt is not None, f"Unsupported type {typ}"
+    return _primitive_codec(base, Struct("<" + fmt))
+
+
+def _message_codec(typ: Type[RosMessage], arrays: bool, views: bool) -> Tuple[_ENCODE_VALUE, _DECODE_VALUE]:
+    codec = get_codec(typ, arrays, views)
+
+    def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+        val = typ()
+        return val, codec.decode(val, buffer, offset)
+
+    return codec.encode, decode
+
+
+def _string_codec() -> Tuple[_ENCODE_VALUE, _DECODE_VALUE]:
+    def encode(val: str, buffer: bytearray) -> None:
+        data = val.encode("utf-8")
+        buffer.extend(_UINT32.pack(len(data)))
+        buffer.extend(data)
+
+    def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+        l, = _UINT32.unpack_from(buffer, offset)
+        offset += 4
+        return str(buffer[offset : offset + l], "utf-8"), offset + l
+
+    return encode, decode
+
+
+def _bytes_codec(size: int, views: bool) -> Tuple[_ENCODE_VALUE, _DECODE_VALUE]:
+    def encode(val: bytes, buffer: bytearray) -> None:
+        if size == 0:
+            buffer.extend(_UINT32.pack(len(val)))
+        else:
+            assert len(val) == size
+        buffer.extend(val)
+
+    def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+        l = size
+        if l == 0:
+            l, = _UINT32.unpack_from(buffer, offset)
+            offset += 4
+        if views:
+            return buffer[offset : offset + l], offset + l
+        return bytes(buffer[offset : offset + l]), offset + l
+
+    return encode, decode
+
+
+def _primitive_codec(base: Any, s: Struct) -> Tuple[_ENCODE_VALUE, _DECODE_VALUE]:
+    if base is Time or base is Duration:
+        def encode(val: Any, buffer: bytearray) -> None:
+            buffer.extend(s.pack(val.secs, val.nsecs))
+
+        def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+            secs, nsecs = s.unpack_from(buffer, offset)
+            return base(secs, nsecs), offset + 8
+
+        return encode, decode
+
+    def encode(val: Any, buffer: bytearray) -> None:
+        buffer.extend(s.pack(val))
+
+    def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+        val, = s.unpack_from(buffer, offset)
+        return val, offset + s.size
+
+    return encode, decode
+
+
+def _decode_array(fmt: str, buffer: Any, offset: int, l: int) -> Any:
+    if np is not None:
+        return np.frombuffer(buffer, np.dtype("<" + fmt), l, offset)
+
+    val = array(fmt)
+    val.frombytes(buffer[offset : offset + l * val.itemsize])
+    if sys.byteorder == "big":  # pragma: no cover
+        val.byteswap()
+    return val
+
+
+def _list_codec(elem: Any, size: int, arrays: bool, views: bool) -> Tuple[_ENCODE_VALUE, _DECODE_VALUE]:
+    fmt = _primitive_format(elem)
+
+    # lists of numbers are packed and unpacked with a single struct call
+    if fmt is not None and len(fmt) == 1:
+        item_size = struct.calcsize(fmt)
+        as_array = arrays and fmt in _ARRAY_FORMATS
+
+        def encode(val: Any, buffer: bytearray) -> None:
+            if isinstance(val, (list, tuple)):
+                l = len(val)
+                data: Any = struct.pack(f"<{l}{fmt}", *val)
+            elif np is not None and isinstance(val, np.ndarray):
+                # arrays with more than one dimension are written flattened in C order
+                data = np.ascontiguousarray(val, np.dtype("<" + fmt))
+                l = data.size
+            else:
+                # any other buffer is expected to already contain the little endian values
+                data = memoryview(val).cast("B")
+                l, rest = divmod(len(data), item_size)
+                assert rest == 0
+
+            if size == 0:
+                buffer.extend(_UINT32.pack(l))
+            else:
+                assert l == size
+            buffer.extend(data)
+
+        def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+            l = size
+            if l == 0:
+                l, = _UINT32.unpack_from(buffer, offset)
+                offset += 4
+            if as_array:
+                return _decode_array(fmt, buffer, offset, l), offset + l * item_size
+            return list(struct.unpack_from(f"<{l}{fmt}", buffer, offset)), offset + l * item_size
+
+        return encode, decode
+
+    encode_elem, decode_elem = _value_codec(elem, arrays, views)
+
+    def encode(val: Any, buffer: bytearray) -> None:
+        if size == 0:
+            buffer.extend(_UINT32.pack(len(val)))
+        else:
+            assert len(val) == size
+        for v in val:
+            encode_elem(v, buffer)
+
+    def decode(buffer: Any, offset: int) -> Tuple[Any, int]:
+        l = size
+        if l == 0:
+            l, = _UINT32.unpack_from(buffer, offset)
+            offset += 4
+
+        val = []
+        for _ in range(l):
+            v, offset = decode_elem(buffer, offset)
+            val.append(v)
+        return val, offset
+
+    return encode, decode
+
+
+def _reuse_decoder(name: str, typ: Any, arrays: bool, views: bool) -> Optional[_DECODE_OP]:
+    """decoder for a field of nested messages which decodes into the instances of the previous message"""
+    if get_origin(typ) is None and issubclass(typ, RosMessage):
+        codec = get_codec(typ, arrays, views)
+
+        def decode(msg: RosMessage, buffer: Any, offset: int) -> int:
+            val = getattr(msg, name, None)
+            if type(val) is not typ:
+                val = typ()
+                setattr(msg, name, val)
+            return codec.decode_into(val, buffer, offset)
+
+        return decode
+
+    base, size, _ = get_args(typ)
+    if get_origin(base) is not list:
+        return None
+    elem, *_ = get_args(base)
+    if get_origin(elem) is not None or not issubclass(elem, RosMessage):
+        return None
+
+    elem_codec = get_codec(elem, arrays, views)
+
+    def decode_list(msg: RosMessage, buffer: Any, offset: int) -> int:
+        l = size
+        if l == 0:
+            l, = _UINT32.unpack_from(buffer, offset)
+            offset += 4
+
+        val = getattr(msg, name, None)
+        if type(val) is not list:
+            val = []
+            setattr(msg, name, val)
+        del val[l:]
+
+        for i in range(l):
+            if i == len(val):
+                val.append(elem())
+            elif type(val[i]) is not elem:
+                val[i] = elem()
+            offset = elem_codec.decode_into(val[i], buffer, offset)
+        return offset
+
+    return decode_list
+
+
+def _fixed_size(typ: Any) -> Optional[int]:
+    """size of a value of the given type on the wire, None if it depends on the value"""
+    if get_origin(typ) is None and issubclass(typ, RosMessage):
+        return get_codec(typ).size
+
+    fmt = _primitive_format(typ)
+    if fmt is not None:
+        return struct.calcsize("<" + fmt)
+
+    base, size, _ = get_args(typ)
+    if size == 0 or base is str:
+        return None
+    if base is bytes:
+        return size
+    if get_origin(base) is list:
+        elem_size = _fixed_size(get_args(base)[0])
+        return None if elem_size is None else size * elem_size
+    return None
+
+
+def _value_skip(typ: Any) -> Callable[[Any, int], int]:
+    """function which returns the offset behind a value of the given type without decoding it"""
+    fixed = _fixed_size(typ)
+    if fixed is not None:
+        return lambda buffer, offset: offset + fixed
+
+    if get_origin(typ) is None and issubclass(typ, RosMessage):
+        return get_codec(typ).skip
+
+    base, size, _ = get_args(typ)
+
+    if get_origin(base) is list:
+        elem, *_ = get_args(base)
+        elem_size = _fixed_size(elem)
+        elem_skip = _value_skip(elem)
+
+        def skip_list(buffer: Any, offset: int) -> int:
+            l = size
+            if l == 0:
+                l, = _UINT32.unpack_from(buffer, offset)
+                offset += 4
+            if elem_size is not None:
+                return offset + l * elem_size
+            for _ in range(l):
+                offset = elem_skip(buffer, offset)
+            return offset
+
+        return skip_list
+
+    # strings and bytes
+    def skip(buffer: Any, offset: int) -> int:
+        l, = _UINT32.unpack_from(buffer, offset)
+        return offset + 4 + l
+
+    return skip
+
+
+class LazyMessage:
+    """Base of lazily decoded messages, a field is decoded from the buffer on its first access.
+
+    The buffer has to stay unchanged as long as the message is used.
+    """
+    # name -> (offset relative to the message start if it does not depend on prior fields, index, decode)
+    __lazy_fields__: Dict[str, Tuple[Optional[int], int, Callable[[Any, int], Any]]]
+    __lazy_skips__: List[Callable[[Any, int], int]]
+
+    def __init__(self, buffer: Any, offset: int = 0) -> None:
+        self.__dict__["_lazy_buffer"] = buffer
+        self.__dict__["_lazy_offset"] = offset
+        self.__dict__["_lazy_offsets"] = None
+
+    def __getattr__(self, name: str) -> Any:
+        field = self.__lazy_fields__.get(name)
+        if field is None:
+            raise AttributeError(name)
+
+        static_offset, index, decode = field
+        buffer = self._lazy_buffer
+
+        if static_offset is not None:
+            offset = self._lazy_offset + static_offset
+        else:
+            offsets = self._lazy_offsets
+            if offsets is None:
+                offsets = self._lazy_offsets = self._compute_offsets()
+            offset = offsets[index]
+
+        val = decode(buffer, offset)
+        setattr(self, name, val)
+        return val
+
+    def _compute_offsets(self) -> List[int]:
+        offsets = []
+        offset = self._lazy_offset
+        for skip in self.__lazy_skips__:
+            offsets.append(offset)
+            offset = skip(self._lazy_buffer, offset)
+        return offsets
+
+
+def _field_names(typ: Type[RosMessage]) -> List[str]:
+    """fields of a message type and of the message types it inherits from, but not the ones of RosMessage"""
+    names: Dict[str, None] = {}
+    for cls in reversed(typ.__mro__):
+        if cls is not RosMessage and issubclass(cls, RosMessage):
+            names.update(dict.fromkeys(cls.__dict__.get("__annotations__", {})))
+    return list(names)
+
+
+class MessageCodec:
+    """Encoder and decoder for one message type, compiled once from its type hints.
+
+    Consecutive fixed size fields are merged into a single struct, all other fields get their own operation.
+    With `arrays` set, lists of numbers are decoded into numpy arrays (or array.array without numpy) instead of lists.
+    With `views` set, bytes fields are decoded as slices of the given buffer, i.e. memoryviews when decoding from one.
+    `decode_into` reuses the nested messages of an already decoded message instead of creating new ones.
+    """
+    typ: Type[RosMessage]
+    fields: List[Tuple[str, Any]]
+    arrays: bool
+    views: bool
+    # size of every message of this type, None if it is not fixed
+    size: Optional[int]
+
+    def __init__(self, typ: Type[RosMessage], arrays: bool = False, views: bool = False) -> None:
+        self.typ = typ
+        self.arrays = arrays
+        self.views = views
+        self.fields = []
+        self._encoders: List[_ENCODE_OP] = []
+        self._decoders: List[_DECODE_OP] = []
+        self._reuse_decoders: List[_DECODE_OP] = []
+        self._skips: Optional[List[Callable[[Any, int], int]]] = None
+        self._lazy_type: Optional[Type[RosMessage]] = None
+
+        hints = get_type_hints(typ, include_extras=True)
+        run: List[Tuple[str, Any, str]] = []
+
+        for name in _field_names(typ):
+            t = hints[name]
+            if get_origin(t) is Final:
+                continue
+
+            self.fields.append((name, t))
+
+            fmt = _primitive_format(t)
+            if fmt is not None:
+                run.append((name, t, fmt))
+                continue
+
+            self._add_run(run)
+            run = []
+            self._add_field(name, t)
+
+        self._add_run(run)
+
+        sizes = [_fixed_size(t) for _, t in self.fields]
+        self.size = None if None in sizes else sum(sizes)  # type: ignore[arg-type]
+
+    def _add_run(self, run: List[Tuple[str, Any, str]]) -> None:
+        if not run:
+            return
+
+        s = Struct("<" + "".join(fmt for _, _, fmt in run))
+        size = s.size
+        names = tuple(name for name, _, _ in run)
+        defaults = tuple((name, t()) for name, t, _ in run)
+        # Time and Duration take two values in the struct
+        times = {name: get_args(t)[0] for name, t, fmt in run if fmt == "II"}
+
+        if not times:
+            def encode(msg: RosMessage, buffer: bytearray) -> None:
+                buffer.extend(s.pack(*[getattr(msg, name, default) for name, default in defaults]))
+
+            def decode(msg: RosMessage, buffer: Any, offset: int) -> int:
+                for name, val in zip(names, s.unpack_from(buffer, offset)):
+                    setattr(msg, name, val)
+                return offset + size
+        else:
+            def encode(msg: RosMessage, buffer: bytearray) -> None:
+                values: List[Any] = []
+                for name, default in defaults:
+                    val = getattr(msg, name, default)
+                    if name in times:
+                        values.append(val.secs)
+                        values.append(val.nsecs)
+                    else:
+                        values.append(val)
+                buffer.extend(s.pack(*values))
+
+            def decode(msg: RosMessage, buffer: Any, offset: int) -> int:
+                values = s.unpack_from(buffer, offset)
+                i = 0
+                for name in names:
+                    if name in times:
+                        setattr(msg, name, times[name](values[i], values[i + 1]))
+                        i += 2
+                    else:
+                        setattr(msg, name, values[i])
+                        i += 1
+                return offset + size
+
+        self._encoders.append(encode)
+        self._decoders.append(decode)
+        self._reuse_decoders.append(decode)
+
+    def _add_field(self, name: str, typ: Any) -> None:
+        encode_value, decode_value = _value_codec(typ, self.arrays, self.views)
+        default = _default(typ)
+
+        def encode(msg: RosMessage, buffer: bytearray) -> None:
+            encode_value(getattr(msg, name, default), buffer)
+
+        def decode(msg: RosMessage, buffer: Any, offset: int) -> int:
+            val, offset = decode_value(buffer, offset)
+            setattr(msg, name, val)
+            return offset
+
+        self._encoders.append(encode)
+        self._decoders.append(decode)
+        self._reuse_decoders.append(_reuse_decoder(name, typ, self.arrays, self.views) or decode)
+
+    def encode(self, msg: RosMessage, buffer: Optional[bytearray] = None) -> bytearray:
+        if buffer is None:
+            buffer = bytearray()
+        for op in self._encoders:
+            op(msg, buffer)
+        return buffer
+
+    def decode(self, msg: RosMessage, buffer: Any, offset: int = 0) -> int:
+        for op in self._decoders:
+            offset = op(msg, buffer, offset)
+        return offset
+
+    def decode_into(self, msg: RosMessage, buffer: Any, offset: int = 0) -> int:
+        for op in self._reuse_decoders:
+            offset = op(msg, buffer, offset)
+        return offset
+
+    def skip(self, buffer: Any, offset: int = 0) -> int:
+        if self.size is not None:
+            return offset + self.size
+
+        if self._skips is None:
+            self._skips = [_value_skip(t) for _, t in self.fields]
+        for skip in self._skips:
+            offset = skip(buffer, offset)
+        return offset
+
+    def lazy_type(self) -> Type[RosMessage]:
+        """subclass of the message type whose instances are created with a buffer and decode their fields lazily"""
+        if self._lazy_type is not None:
+            return self._lazy_type
+
+        fields = {}
+        skips = []
+        static_offset: Optional[int] = 0
+
+        for index, (name, t) in enumerate(self.fields):
+            decode: Callable[[Any, int], Any]
+            if get_origin(t) is None and issubclass(t, RosMessage):
+                decode = get_codec(t, self.arrays, self.views).lazy_type()
+            else:
+                decode_value = _value_codec(t, self.arrays, self.views)[1]
+                decode = lambda buffer, offset, decode_value=decode_value: decode_value(buffer, offset)[0]
+
+            fields[name] = (static_offset, index, decode)
+            skips.append(_value_skip(t))
+
+            size = _fixed_size(t)
+            static_offset = None if static_offset is None or size is None else static_offset + size
+
+        self._lazy_type = type(f"Lazy{self.typ.__name__}", (LazyMessage, self.typ), {
+            "__module__": self.typ.__module__,
+            # lazy messages are encoded like the message type itself
+            "__codecs__": self.typ.__dict__["__codecs__"],
+            "__lazy_fields__": fields,
+            "__lazy_skips__": skips,
+        })
+        return self._lazy_type
+
+
+def get_codec(typ: Type[RosMessage], arrays: bool = False, views: bool = False) -> MessageCodec:
+    # look into __dict__ so that subclasses of a message get their own codecs
+    codecs: Optional[Dict[Tuple[bool, bool], MessageCodec]] = typ.__dict__.get("__codecs__")
+    if codecs is None:
+        codecs = {}
+        typ.__codecs__ = codecs  # type: ignore[attr-defined]
+
+    codec = codecs.get((arrays, views))
+    if codec is None:
+        codec = codecs[(arrays, views)] = MessageCodec(typ, arrays, views)
+    return codec
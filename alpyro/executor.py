@@ -0,0 +1,105 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor
+from functools import partial
+from time import perf_counter_ns
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+from alpyro import trace
+
+EXECUTORS = ("inline", "thread", "process", "async")
+
+
+class CallbackExecutor:
+    """Runs the callback of a subscription outside of the event loop's data_received.
+
+    Messages are passed to the callback one after another in the order they arrived.
+    While the callback is busy they wait in a bounded queue, which drops the oldest message when it is full.
+    """
+    # arguments of the waiting calls with the time they were queued, only taken while tracing
+    pending: Deque[Tuple[Dict[str, Any], int]]
+    running: Optional["asyncio.Future[Any]"] = None
+    dropped: int = 0
+    # time from starting the callbacks until they finished, including the wait for a free worker of the pool
+    callback_ns: int = 0
+    started: int = 0
+
+    def __init__(
+        self,
+        callback: Callable,
+        loop: asyncio.AbstractEventLoop,
+        queue_size: int = 10,
+        latest_only: bool = False,
+        topic: str = "",
+    ):
+        self.callback = callback
+        self.loop = loop
+        self.topic = topic
+        self.pending = deque(maxlen=1 if latest_only else (queue_size or None))
+
+    def __call__(self, **args: Any) -> None:
+        if self.running is None:
+            self._start(args, 0)
+            return
+
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append((args, perf_counter_ns() if trace.tracer is not None else 0))
+
+    def _start(self, args: Dict[str, Any], queued: int) -> None:
+        self.started = perf_counter_ns()
+        tracer = trace.tracer
+        if tracer is not None and queued:
+            tracer.event("queue", self.topic, queued, self.started)
+        self.running = self._run(args)
+        self.running.add_done_callback(self._done)
+
+    def _done(self, fut: "asyncio.Future[Any]") -> None:
+        self.running = None
+        end = perf_counter_ns()
+        self.callback_ns += end - self.started
+        tracer = trace.tracer
+        if tracer is not None:
+            tracer.event("run", self.topic, self.started, end)
+        if not fut.cancelled() and fut.exception() is not None:
+            self.loop.call_exception_handler({
+                "message": "Exception in subscriber callback",
+                "exception": fut.exception(),
+                "future": fut,
+            })
+
+        if self.pending:
+            self._start(*self.pending.popleft())
+
+    def _run(self, args: Dict[str, Any]) -> "asyncio.Future[Any]":
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        self.pending.clear()
+        if self.running is not None:
+            self.running.cancel()
+
+
+class PoolExecutor(CallbackExecutor):
+    """Calls the callback in a thread or process pool"""
+
+    def __init__(
+        self,
+        callback: Callable,
+        loop: asyncio.AbstractEventLoop,
+        pool: Executor,
+        queue_size: int = 10,
+        latest_only: bool = False,
+        topic: str = "",
+    ):
+        super().__init__(callback, loop, queue_size, latest_only, topic)
+        self.pool = pool
+
+    def _run(self, args: Dict[str, Any]) -> "asyncio.Future[Any]":
+        return self.loop.run_in_executor(self.pool, partial(self.callback, **args))
+
+
+class AsyncExecutor(CallbackExecutor):
+    """Awaits a coroutine callback as a task of the event loop"""
+
+    def _run(self, args: Dict[str, Any]) -> "asyncio.Future[Any]":
+        return self.loop.create_task(self.callback(**args))
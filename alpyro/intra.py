@@ -0,0 +1,62 @@
+from copy import deepcopy
+from time import perf_counter_ns
+from typing import Any, Dict
+from alpyro_msgs import RosMessage
+from alpyro import trace
+from alpyro.stats import Counters, connection_id
+
+
+class IntraProcessClient:
+    """Subscription to a publisher of a node in the same process, messages are passed without serialization"""
+
+    def __init__(self, callback, arg_name_msg, arg_name_node, node, copy: bool = False, topic: str = ""):
+        self.callback = callback
+        self.topic = topic
+        self.arg_name_msg = arg_name_msg
+        self.arg_name_node = arg_name_node
+        self.node = node
+        self.copy = copy
+        # the time of the copies is counted as decode time
+        self.stats = Counters()
+        self.id = connection_id()
+
+    def deliver(self, msg: RosMessage) -> None:
+        stats = self.stats
+        stats.messages += 1
+        start = perf_counter_ns()
+        if self.copy:
+            msg = deepcopy(msg)
+            copied = perf_counter_ns()
+            stats.decode_ns += copied - start
+            start = copied
+
+        args: Dict[str, Any] = {self.arg_name_msg: msg}
+        if self.arg_name_node:
+            args[self.arg_name_node] = self.node
+
+        try:
+            self.callback(**args)
+        except Exception as e:
+            # an exception in the subscriber should not end up in the publisher
+            self.node.loop.call_exception_handler({
+                "message": "Exception in intra process callback",
+                "exception": e,
+                "protocol": self,
+            })
+        end = perf_counter_ns()
+        stats.callback_ns += end - start
+
+        tracer = trace.tracer
+        if tracer is not None:
+            tracer.event("callback", self.topic, start, end)
+
+
+class IntraProcessTransport:
+    """Removes an intra process subscription from the publishing node once it is closed"""
+
+    def __init__(self, clients: Dict[str, IntraProcessClient], name: str):
+        self.clients = clients
+        self.name = name
+
+    def close(self) -> None:
+        self.clients.pop(self.name, None)
@@ -0,0 +1,254 @@
+import sys
+from asyncio import AbstractEventLoop, Task, get_event_loop
+from typing import Any, Dict, List, Optional, Set, Tuple
+from alpyro.names import canonical, namespace, related, resolve
+from alpyro.xmlrpc import XMLRPCClient, XMLRPCServer, XMLRPCValue
+
+
+class Master(XMLRPCServer):
+    """ROS master running in the event loop, with the topic registration and the parameter server.
+
+    It is meant for tests, benchmarks and small setups without a roscore. Subscribers get publisherUpdate and
+    paramUpdate calls like from the real master.
+    """
+    name = "/master"
+
+    # caller id -> API of the node by topic
+    publishers: Dict[str, Dict[str, str]]
+    subscribers: Dict[str, Dict[str, str]]
+    topic_types: Dict[str, str]
+    # service -> (caller id, service API)
+    services: Dict[str, Tuple[str, str]]
+    nodes: Dict[str, str]
+
+    params: Dict[str, Any]
+    param_subscribers: Dict[str, Dict[str, str]]
+
+    def __init__(self, port: int = 0, loop: Optional[AbstractEventLoop] = None) -> None:
+        super().__init__(loop=loop or get_event_loop())
+        self.port = port
+        self.rpc = XMLRPCClient()
+        self.publishers = {}
+        self.subscribers = {}
+        self.topic_types = {}
+        self.services = {}
+        self.nodes = {}
+        self.params = {}
+        self.param_subscribers = {}
+        self._calls: Set["Task[None]"] = set()
+
+    async def open_async(self) -> None:
+        await self.start_server(self.port)
+
+    async def close_async(self) -> None:
+        for task in list(self._calls):
+            task.cancel()
+        self.loop_server.close()
+        await self.rpc.close()
+
+    def __enter__(self):
+        self.loop.run_until_complete(self.open_async())
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.loop.run_until_complete(self.close_async())
+
+    async def __aenter__(self):
+        await self.open_async()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close_async()
+
+    def _notify(self, uri: str, method: str, *args: Any) -> None:
+        task = self.loop.create_task(self._call(uri, method, *args))
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+
+    async def _call(self, uri: str, method: str, *args: Any) -> None:
+        try:
+            await self.rpc.call(uri, method, *args)
+        except Exception as e:
+            print(f"Calling {method} of {uri} failed: {e!r}")
+
+    def _publisher_update(self, topic: str) -> None:
+        pubs = list(self.publishers.get(topic, {}).values())
+        for uri in self.subscribers.get(topic, {}).values():
+            self._notify(uri, "publisherUpdate", self.name, topic, pubs)
+
+    # topics and services
+    async def registerPublisher(self, caller_id: str, topic: str, topic_type: str, caller_api: str) -> Tuple[int, str, List[str]]:
+        self.nodes[caller_id] = caller_api
+        self.publishers.setdefault(topic, {})[caller_id] = caller_api
+        self.topic_types.setdefault(topic, topic_type)
+        self._publisher_update(topic)
+        return 1, f"Registered [{caller_id}] as publisher of [{topic}]", list(self.subscribers.get(topic, {}).values())
+
+    async def unregisterPublisher(self, caller_id: str, topic: str, caller_api: str) -> Tuple[int, str, int]:
+        if self.publishers.get(topic, {}).get(caller_id) != caller_api:
+            return 1, f"[{caller_id}] is not a publisher of [{topic}]", 0
+        del self.publishers[topic][caller_id]
+        self._publisher_update(topic)
+        return 1, f"Unregistered [{caller_id}] as publisher of [{topic}]", 1
+
+    async def registerSubscriber(self, caller_id: str, topic: str, topic_type: str, caller_api: str) -> Tuple[int, str, List[str]]:
+        self.nodes[caller_id] = caller_api
+        self.subscribers.setdefault(topic, {})[caller_id] = caller_api
+        # subscribers of any type (*) don't define the type of a topic
+        if topic_type != "*":
+            self.topic_types.setdefault(topic, topic_type)
+        return 1, f"Subscribed to [{topic}]", list(self.publishers.get(topic, {}).values())
+
+    async def unregisterSubscriber(self, caller_id: str, topic: str, caller_api: str) -> Tuple[int, str, int]:
+        if self.subscribers.get(topic, {}).get(caller_id) != caller_api:
+            return 1, f"[{caller_id}] is not a subscriber of [{topic}]", 0
+        del self.subscribers[topic][caller_id]
+        return 1, f"Unregistered [{caller_id}] as subscriber of [{topic}]", 1
+
+    async def registerService(self, caller_id: str, service: str, service_api: str, caller_api: str) -> Tuple[int, str, int]:
+        self.nodes[caller_id] = caller_api
+        self.services[service] = (caller_id, service_api)
+        return 1, f"Registered [{caller_id}] as provider of [{service}]", 1
+
+    async def unregisterService(self, caller_id: str, service: str, service_api: str) -> Tuple[int, str, int]:
+        if self.services.get(service) != (caller_id, service_api):
+            return 1, f"[{caller_id}] is not the provider of [{service}]", 0
+        del self.services[service]
+        return 1, f"Unregistered [{caller_id}] as provider of [{service}]", 1
+
+    async def lookupNode(self, caller_id: str, node_name: str) -> Tuple[int, str, str]:
+        uri = self.nodes.get(node_name)
+        if uri is None:
+            return -1, f"unknown node [{node_name}]", ""
+        return 1, node_name, uri
+
+    async def lookupService(self, caller_id: str, service: str) -> Tuple[int, str, str]:
+        if service not in self.services:
+            return -1, f"no provider for [{service}]", ""
+        return 1, service, self.services[service][1]
+
+    async def getPublishedTopics(self, caller_id: str, subgraph: str) -> Tuple[int, str, List[List[str]]]:
+        topics = [
+            [topic, self.topic_types.get(topic, "*")]
+            for topic, pubs in self.publishers.items()
+            if pubs and topic.startswith(subgraph)
+        ]
+        return 1, "current topics", topics
+
+    async def getTopicTypes(self, caller_id: str) -> Tuple[int, str, List[List[str]]]:
+        return 1, "current topics", [[topic, typ] for topic, typ in self.topic_types.items()]
+
+    async def getSystemState(self, caller_id: str) -> Tuple[int, str, List[XMLRPCValue]]:
+        pubs = [[topic, list(nodes)] for topic, nodes in self.publishers.items() if nodes]
+        subs = [[topic, list(nodes)] for topic, nodes in self.subscribers.items() if nodes]
+        services = [[service, [caller_id]] for service, (caller_id, _) in self.services.items()]
+        return 1, "current system state", [pubs, subs, services]
+
+    async def getUri(self, caller_id: str) -> Tuple[int, str, str]:
+        return 1, "", self.uri
+
+    # parameter server
+    def _get(self, key: str) -> Tuple[bool, Any]:
+        val: Any = self.params
+        for part in key.split("/")[1:] if key != "/" else []:
+            if not isinstance(val, dict) or part not in val:
+                return False, None
+            val = val[part]
+        return True, val
+
+    def _param_update(self, key: str) -> None:
+        for sub_key, callers in self.param_subscribers.items():
+            if not related(sub_key, key):
+                continue
+            found, val = self._get(sub_key)
+            for uri in callers.values():
+                self._notify(uri, "paramUpdate", self.name, sub_key, val if found else {})
+
+    async def setParam(self, caller_id: str, key: str, value: XMLRPCValue) -> Tuple[int, str, int]:
+        key = resolve(caller_id, key)
+        if key == "/":
+            assert isinstance(value, dict)
+            self.params = value
+        else:
+            *path, name = key.split("/")[1:]
+            node = self.params
+            for part in path:
+                if not isinstance(node.get(part), dict):
+                    node[part] = {}
+                node = node[part]
+            node[name] = value
+
+        self._param_update(key)
+        return 1, f"parameter [{key}] set", 0
+
+    async def getParam(self, caller_id: str, key: str) -> Tuple[int, str, XMLRPCValue]:
+        key = resolve(caller_id, key)
+        found, val = self._get(key)
+        if not found:
+            return -1, f"Parameter [{key}] is not set", 0
+        return 1, f"Parameter [{key}]", val
+
+    async def deleteParam(self, caller_id: str, key: str) -> Tuple[int, str, int]:
+        key = resolve(caller_id, key)
+        parent, _, name = key.rpartition("/")
+        found, node = self._get(parent or "/")
+        if not found or not isinstance(node, dict) or name not in node:
+            return -1, f"parameter [{key}] is not set", 0
+
+        del node[name]
+        self._param_update(key)
+        return 1, f"parameter [{key}] deleted", 0
+
+    async def hasParam(self, caller_id: str, key: str) -> Tuple[int, str, bool]:
+        key = resolve(caller_id, key)
+        return 1, key, self._get(key)[0]
+
+    async def searchParam(self, caller_id: str, key: str) -> Tuple[int, str, str]:
+        if key.startswith("/"):
+            found = self._get(canonical(key))[0]
+            return (1, "found", canonical(key)) if found else (-1, f"parameter [{key}] not found", "")
+
+        head, _, rest = key.lstrip("~").partition("/")
+        ns = namespace(caller_id)
+        while True:
+            if self._get(canonical(ns + head))[0]:
+                return 1, "found", canonical(ns + key)
+            if ns == "/":
+                return -1, f"parameter [{key}] not found", ""
+            ns = ns.rstrip("/").rsplit("/", 1)[0] + "/"
+
+    async def getParamNames(self, caller_id: str) -> Tuple[int, str, List[str]]:
+        names: List[str] = []
+
+        def collect(prefix: str, node: Dict[str, Any]) -> None:
+            for name, val in node.items():
+                if isinstance(val, dict):
+                    collect(f"{prefix}/{name}", val)
+                else:
+                    names.append(f"{prefix}/{name}")
+
+        collect("", self.params)
+        return 1, "Parameter names", names
+
+    async def subscribeParam(self, caller_id: str, caller_api: str, key: str) -> Tuple[int, str, XMLRPCValue]:
+        key = resolve(caller_id, key)
+        self.nodes[caller_id] = caller_api
+        self.param_subscribers.setdefault(key, {})[caller_id] = caller_api
+        found, val = self._get(key)
+        return 1, f"Subscribed to parameter [{key}]", val if found else {}
+
+    async def unsubscribeParam(self, caller_id: str, caller_api: str, key: str) -> Tuple[int, str, int]:
+        key = resolve(caller_id, key)
+        if self.param_subscribers.get(key, {}).pop(caller_id, None) is None:
+            return 1, f"[{caller_id}] is not subscribed to parameter [{key}]", 0
+        return 1, f"Unsubscribed from parameter [{key}]", 1
+
+
+if __name__ == "__main__":
+    master = Master(int(sys.argv[1]) if len(sys.argv) > 1 else 11311)
+    with master:
+        print(f"ROS_MASTER_URI={master.uri}")
+        try:
+            master.loop.run_forever()
+        except KeyboardInterrupt:
+            pass
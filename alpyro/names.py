@@ -0,0 +1,31 @@
+from typing import List
+
+
+def canonical(name: str) -> str:
+    """global name without duplicate or trailing slashes"""
+    return "/" + "/".join(p for p in name.split("/") if p)
+
+
+def namespace(caller_id: str) -> str:
+    """namespace of a node with a trailing slash"""
+    return canonical(caller_id).rsplit("/", 1)[0] + "/"
+
+
+def resolve(caller_id: str, name: str) -> str:
+    """global name of a global, private (~) or relative name used by a node"""
+    if name.startswith("/"):
+        return canonical(name)
+    if name.startswith("~"):
+        return canonical(caller_id + "/" + name[1:])
+    return canonical(namespace(caller_id) + name)
+
+
+def related(a: str, b: str) -> bool:
+    """one of the names is the other one or in its namespace"""
+    return a == b or a.startswith(b.rstrip("/") + "/") or b.startswith(a.rstrip("/") + "/")
+
+
+def ancestors(name: str) -> List[str]:
+    """the name and all namespaces containing it, starting with the root"""
+    parts = name.split("/")[1:] if name != "/" else []
+    return ["/"] + ["/" + "/".join(parts[: i + 1]) for i in range(len(parts))]
@@ -1,10 +1,22 @@
 import asyncio
-from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union, get_args, get_origin, get_type_hints
+import pickle
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextvars import Context, ContextVar
+from time import perf_counter_ns
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin, get_type_hints
 from alpyro_msgs import RosMessage
 from dataclasses import dataclass
-from asyncio import BaseProtocol, BaseTransport, get_event_loop, sleep
-from alpyro.xmlrpc import XMLRPCServer, XMLRPCValue
-from alpyro.tcp import TCPROSClient, TCPROSServer
+from asyncio import AbstractServer, BaseProtocol, BaseTransport, Task, get_event_loop, sleep
+from alpyro import trace
+from alpyro.xmlrpc import XMLRPCClient, XMLRPCServer, XMLRPCValue, local_server
+from alpyro.tcp import AnyMsg, TCPROSClient, TCPROSConverter, TCPROSServer
+from alpyro.intra import IntraProcessClient, IntraProcessTransport
+from alpyro.udp import MAX_DATAGRAM_SIZE, UDPROSClient, UDPROSServer
+from alpyro.shm import ShmWriter
+from alpyro.executor import EXECUTORS, AsyncExecutor, CallbackExecutor, PoolExecutor
+from alpyro.scheduler import Scheduler
+from alpyro.stats import Counters
+from weakref import WeakValueDictionary
 from xmlrpc.client import ServerProxy
 import os
 from alpyro.parameter import ParameterApi
@@ -20,10 +32,16 @@ _MSG_FACTORY = Union[
     Callable[["Node", Optional[RosMessage]],  RosMessage],
 ]
 
+_T = TypeVar("_T")
+
+# set while a sync API method is called from inside the running event loop
+_BLOCKING: ContextVar[bool] = ContextVar("_BLOCKING", default=False)
+
 _CALLBACK_TYPE = Union[
     Callable[[RosMessage], None],
     Callable[[RosMessage, "Node"], None],
-    Callable[["Node", RosMessage], None]
+    Callable[["Node", RosMessage], None],
+    Callable[..., Coroutine[Any, Any, None]],
 ]
 
 def get_callback_type(f: _CALLBACK_TYPE) -> Tuple[Type[RosMessage], str, str]:
@@ -49,6 +67,37 @@ def get_callback_type(f: _CALLBACK_TYPE) -> Tuple[Type[RosMessage], str, str]:
 
 
 
+def _connection(id: int, destination: str, transport: str, connected: bool, stats: Counters, dropped: int, queue: int) -> Dict[str, Any]:
+    return {
+        "id": id,
+        "destination": destination,
+        "transport": transport,
+        "connected": connected,
+        **stats.as_dict(),
+        "dropped": dropped,
+        "queue": queue,
+    }
+
+
+def _transport(protocol: Any) -> str:
+    if isinstance(protocol, (UDPROSServer, UDPROSClient)):
+        return "UDPROS"
+    return "SHMROS" if protocol.shm else "TCPROS"
+
+
+def _topic(stats: Counters, connections: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        **stats.as_dict(),
+        "dropped": sum(c["dropped"] for c in connections),
+        "queue": sum(c["queue"] for c in connections),
+        "connections": connections,
+    }
+
+
+# all open nodes of this process by their URI
+_LOCAL_NODES: "WeakValueDictionary[str, Node]" = WeakValueDictionary()
+
+
 @dataclass
 class Subscription:
     topic: str
@@ -66,97 +115,567 @@ class Node(XMLRPCServer):
     topic_typ: Dict[str, Type[RosMessage]]
 
     callbacks: Dict[str,Tuple[_CALLBACK_TYPE, str, str]]
+    sub_options: Dict[str, Dict[str, Any]]
+    pub_options: Dict[str, Dict[str, Any]]
+    # options of subscriptions to publishers in the same process, None if they should use TCPROS as well
+    local_options: Dict[str, Optional[Dict[str, Any]]]
+    # subscribers of a topic in the same process
+    local_subs: Dict[str, Dict[str, IntraProcessClient]]
+    # callbacks of subscribed parameters by their global name
     param_callbacks: Dict[str, Callable]
+    # shared memory rings of published topics for subscribers on the same host, created on the first request
+    shm_sizes: Dict[str, int]
+    shm_writers: Dict[str, ShmWriter]
+    # subscriptions whose callbacks don't run inline, the pools are created when they are first needed
+    executors: Dict[str, CallbackExecutor]
+    thread_pool: Optional[ThreadPoolExecutor] = None
+    process_pool: Optional[ProcessPoolExecutor] = None
+    # messages published on each topic and the time spent encoding them, the connections count their own traffic
+    pub_stats: Dict[str, Counters]
+    # last message of latched topics including the length prefix, sent to each new subscriber
+    latched: Dict[str, Optional[bytes]]
 
     param: ParameterApi
-
-    def __init__(self, name: str, core: Optional[str] = None) -> None:
+    converter: TCPROSConverter
+    # periodic publications of schedule_publish
+    scheduler: Scheduler
+    rpc: XMLRPCClient
+
+    # limits for setting up connections to publishers, connecting contains the running setups by (topic, publisher)
+    connect_limit: asyncio.Semaphore
+    connect_timeout: float
+    connect_retries: int
+    connecting: Dict[Tuple[str, str], "asyncio.Task[None]"]
+
+    # one TCPROS server socket for all topics of this node
+    tcpros_server: AbstractServer
+    tcpros_port: int
+
+    def __init__(
+        self,
+        name: str,
+        core: Optional[str] = None,
+        connect_limit: int = 16,
+        connect_timeout: float = 5.0,
+        connect_retries: int = 3,
+    ) -> None:
         super().__init__(loop=get_event_loop())
         self.name = name
+        self.rpc = XMLRPCClient()
+        self.connect_limit = asyncio.Semaphore(connect_limit)
+        self.connect_timeout = connect_timeout
+        self.connect_retries = connect_retries
+        self.connecting = {}
         self.subs = {}
         self.pubs = {}
         self.topic_typ = {}
         self.callbacks = {}
+        self.sub_options = {}
+        self.pub_options = {}
+        self.local_options = {}
+        self.local_subs = {}
         self.param_callbacks = {}
+        self.shm_sizes = {}
+        self.shm_writers = {}
+        self.executors = {}
+        self.pub_stats = {}
+        self.latched = {}
         self.param = ParameterApi(self)
+        self.converter = TCPROSConverter()
+        self.scheduler = Scheduler(self.loop)
 
         self.core = core if core else os.getenv("ROS_MASTER_URI", "http://localhost:11311/")
 
-    def __enter__(self):
-        self.create_server()
-        self.m = ServerProxy(self.core)
-        code, *_ = self.m.getSystemState(self.name)
+    async def start_server(self):
+        await super().start_server()
+
+        self.tcpros_server = await self.loop.create_server(self._tcpros_server, "0.0.0.0", 0)
+        _, self.tcpros_port = self.tcpros_server.sockets[0].getsockname()
+
+    def _tcpros_server(self) -> TCPROSServer:
+        return TCPROSServer(self.name, self.__publication, self.__add_pub_serv, self.__delete_pub_serv, self.__shm_writer)
+
+    def __shm_writer(self, topic: str) -> ShmWriter:
+        if topic not in self.shm_writers:
+            self.shm_writers[topic] = ShmWriter(self.shm_sizes[topic])
+        return self.shm_writers[topic]
+
+    def _sync(self, coro: Coroutine[Any, Any, _T]) -> _T:
+        if not self.loop.is_running():
+            return self.loop.run_until_complete(coro)
+
+        # called from a callback, the loop can't wait for the coroutine so it runs with blocking XML-RPC calls
+        token = _BLOCKING.set(True)
+        try:
+            coro.send(None)
+        except StopIteration as e:
+            return e.value
+        finally:
+            _BLOCKING.reset(token)
+        raise RuntimeError("Coroutine was suspended in blocking mode")
+
+    async def _rpc(self, uri: str, method: str, *args: Any) -> Any:
+        if _BLOCKING.get():
+            # a server in this loop can't answer while the loop waits for the blocking call
+            server = local_server(uri)
+            if server is not None and server.loop is self.loop:
+                raise RuntimeError(
+                    f"{method} of {uri} is answered by the event loop of {self.name} and can't be called from a "
+                    "callback, use the *_async variant instead"
+                )
+            return getattr(ServerProxy(uri), method)(*args)
+        return await getattr(self.rpc.proxy(uri), method)(*args)
+
+    def _create_task(self, coro: Coroutine[Any, Any, _T]) -> "Task[_T]":
+        """start a background task, which doesn't inherit the blocking mode of a sync call that started it"""
+        return Context().run(self.loop.create_task, coro)
+
+    async def open_async(self) -> None:
+        await self.start_server()
+        code, *_ = await self._rpc(self.core, "getSystemState", self.name)
         assert code == 1
-        return self
+        _LOCAL_NODES[self.uri] = self
+
+    async def close_async(self) -> None:
+        for task in list(self.connecting.values()):
+            task.cancel()
+        self.scheduler.close()
+
+        _LOCAL_NODES.pop(self.uri, None)
+        for local in self.local_subs.values():
+            local.clear()
 
-    def __exit__(self, type, value, traceback):
         for sub_topic, subs in self.subs.items():
-            code, msg, _ = self.m.unregisterSubscriber(self.name, sub_topic, self.uri)
+            code, msg, _ = await self._rpc(self.core, "unregisterSubscriber", self.name, sub_topic, self.uri)
             assert code == 1
 
             for sub in subs.values():
                 sub.transport.close()
 
         for pub_topic, pubs in self.pubs.items():
-            code, msg, _ = self.m.unregisterPublisher(self.name, pub_topic, self.uri)
+            code, msg, _ = await self._rpc(self.core, "unregisterPublisher", self.name, pub_topic, self.uri)
             assert code == 1
 
+            for ps in list(pubs.values()):
+                ps.transport.close()
+
+        for writer in self.shm_writers.values():
+            writer.close()
+        self.shm_writers.clear()
+
+        for executor in self.executors.values():
+            executor.close()
+        for pool in (self.thread_pool, self.process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False)
+
+        self.tcpros_server.close()
         self.loop_server.close()
-        self.loop.stop()
+        if _BLOCKING.get():
+            # closed later, the loop can't wait for it during a sync call from a callback
+            self._create_task(self.rpc.close())
+        else:
+            await self.rpc.close()
 
         print(f"Shutting down node {self.name}")
-        return issubclass(type, KeyboardInterrupt)
+
+    def __enter__(self):
+        self._sync(self.open_async())
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self._sync(self.close_async())
+        if self.loop.is_running():
+            self.loop.stop()
+        return type is not None and issubclass(type, KeyboardInterrupt)
+
+    async def __aenter__(self):
+        await self.open_async()
+        return self
+
+    async def __aexit__(self, type, value, traceback):
+        await self.close_async()
 
     async def __subscribe__(self, pub: str, topic: str, typ: Type[RosMessage]) -> None:
         if topic in self.subs and pub in self.subs[topic]:
             return
 
+        callback, arg_name_msg, arg_name_node = self.callbacks[topic]
+
+        local = _LOCAL_NODES.get(pub.rstrip("/"))
+        local_options = self.local_options[topic]
+        if (
+            local_options is not None
+            and local is not None
+            and local.loop is self.loop
+            and topic in local.pubs
+            # messages can only be passed on directly if both use the same class
+            and local.topic_typ[topic] is typ
+        ):
+            print(f"subscribing to {topic} of {pub} in the same process")
+            clients = local.local_subs[topic]
+            clients[self.name] = IntraProcessClient(callback, arg_name_msg, arg_name_node, self, topic=topic, **local_options)
+            self.subs[topic][pub] = Subscription(topic, pub, IntraProcessTransport(clients, self.name), clients[self.name])
+            local.scheduler.resume(topic)
+
+            frame = local.latched.get(topic)
+            if frame is not None:
+                msg = typ()
+                self.converter.decode(msg, memoryview(frame)[4:])
+                clients[self.name].deliver(msg)
+            return
+
         print(f"requesting topic {topic} from {pub}")
 
-        code, status, params = ServerProxy(pub).requestTopic(self.name, topic, [["TCPROS"]])  # type: ignore
-        prot, hostname, port = params  # type: ignore
+        options = dict(self.sub_options[topic])
+        protocols: _PROTO_INFO = [("TCPROS",)]
+        if options.pop("shm"):
+            protocols.insert(0, ("SHMROS", self.addr[0]))
+
+        udp: Optional[UDPROSClient] = None
+        if options.pop("udp", False):
+            udp_transport, udp = await self.loop.create_datagram_endpoint(
+                lambda: UDPROSClient(callback, typ, self.name, topic, arg_name_msg, arg_name_node, self, **options),
+                local_addr=("0.0.0.0", 0),
+            )
+            _, udp_port = udp_transport.get_extra_info("sockname")[:2]
+            header = self.converter.encode_header(typ, self.name, topic)[4:]
+            protocols.insert(0, ("UDPROS", header, self.addr[0], udp_port, MAX_DATAGRAM_SIZE))
+
+        try:
+            code, status, params = await self._rpc(pub, "requestTopic", self.name, topic, protocols)
+            if code != 1:
+                raise ConnectionError(status)
+        except BaseException:
+            if udp is not None:
+                udp_transport.close()
+            raise
+
+        if params[0] == "UDPROS":
+            _, hostname, port, conn_id, max_datagram_size, header = params
+            udp.accept(conn_id, header)  # type: ignore
+            self.subs[topic][pub] = Subscription(topic, pub, udp_transport, udp)  # type: ignore
+            return
+        if udp is not None:
+            # the publisher doesn't support UDPROS
+            udp_transport.close()
 
-        callback, arg_name_msg, arg_name_node = self.callbacks[topic]
+        prot, hostname, port = params
+        options["shm"] = prot == "SHMROS"
 
         transport, protocol = await self.loop.create_connection(
-            lambda: TCPROSClient(callback, typ, self.name, topic, arg_name_msg, arg_name_node, self), hostname, port
+            lambda: TCPROSClient(callback, typ, self.name, topic, arg_name_msg, arg_name_node, self, **options),
+            hostname,
+            port,
         )
 
         self.subs[topic][pub] = Subscription(topic, pub, transport, protocol)
 
-    def subscribe(self, topic: str, callback:_CALLBACK_TYPE) -> None:
-        typ, msg_name, node_name = get_callback_type(callback)
+    async def __connect(self, pub: str, topic: str, typ: Type[RosMessage]) -> None:
+        delay = 0.1
+        for attempt in range(self.connect_retries):
+            try:
+                async with self.connect_limit:
+                    await asyncio.wait_for(self.__subscribe__(pub, topic, typ), self.connect_timeout)
+                return
+            except Exception as e:
+                print(f"connecting to {pub} for {topic} failed ({attempt + 1}/{self.connect_retries}): {e!r}")
+            if attempt + 1 < self.connect_retries:
+                await sleep(delay)
+                delay *= 2
+        print(f"giving up connecting to {pub} for {topic}")
+
+    def __start_connect(self, pub: str, topic: str) -> None:
+        key = (topic, pub)
+        if key in self.connecting or pub in self.subs[topic]:
+            return
 
-        code, msg, pubs  = self.m.registerSubscriber(self.name, topic, typ.__msg_typ__, self.uri) #type: ignore
+        task = self._create_task(self.__connect(pub, topic, self.topic_typ[topic]))
+        self.connecting[key] = task
+        task.add_done_callback(lambda _: self.connecting.pop(key, None))
+
+    async def subscribe_async(
+        self,
+        topic: str,
+        callback: _CALLBACK_TYPE,
+        arrays: bool = False,
+        views: bool = False,
+        lazy: bool = False,
+        intra_process: bool = True,
+        copy: bool = False,
+        shm: bool = False,
+        executor: Optional[str] = None,
+        queue_size: int = 10,
+        latest_only: bool = False,
+        tcp_nodelay: bool = True,
+        reuse: bool = False,
+        udp: bool = False,
+    ) -> None:
+        typ, msg_name, node_name = get_callback_type(callback)
+        if executor is None:
+            executor = "async" if asyncio.iscoroutinefunction(callback) else "inline"
+        assert executor in EXECUTORS
+        # a reused message is overwritten by the next one, so it can only be passed to inline callbacks
+        assert not reuse or executor == "inline"
+        if executor == "process":
+            # messages and callback are pickled, views of the receive buffers can't be sent to another process
+            assert not node_name and not views and not lazy
+            pickle.dumps(callback)
+
+        code, msg, pubs = await self._rpc(self.core, "registerSubscriber", self.name, topic, typ.__msg_typ__, self.uri)
         assert code == 1
 
+        if executor != "inline":
+            callback = self.__executor(topic, callback, executor, queue_size, latest_only)
+
         self.callbacks[topic] = (callback, msg_name, node_name)
+        self.sub_options[topic] = {
+            "arrays": arrays,
+            "views": views,
+            "lazy": lazy,
+            "shm": shm,
+            "tcp_nodelay": tcp_nodelay,
+            "reuse": reuse,
+            "udp": udp,
+        }
+        # published messages are passed on as they are, so subscriptions with decode options always use TCPROS
+        decoded = arrays or views or lazy or reuse
+        self.local_options[topic] = {"copy": copy} if intra_process and not decoded else None
         self.topic_typ[topic] = typ
         self.subs[topic] = {}
 
-        for p in pubs: #type: ignore
-            self.loop.create_task(self.__subscribe__(p, topic, typ))
+        for p in pubs:
+            self.__start_connect(p, topic)
+
+    def subscribe(
+        self,
+        topic: str,
+        callback: _CALLBACK_TYPE,
+        arrays: bool = False,
+        views: bool = False,
+        lazy: bool = False,
+        intra_process: bool = True,
+        copy: bool = False,
+        shm: bool = False,
+        executor: Optional[str] = None,
+        queue_size: int = 10,
+        latest_only: bool = False,
+        tcp_nodelay: bool = True,
+        reuse: bool = False,
+        udp: bool = False,
+    ) -> None:
+        self._sync(self.subscribe_async(
+            topic, callback, arrays, views, lazy, intra_process, copy, shm, executor, queue_size, latest_only, tcp_nodelay, reuse, udp
+        ))
+
+    async def subscribe_raw_async(
+        self,
+        topic: str,
+        callback: Callable[[memoryview, Dict[str, str]], None],
+        shm: bool = False,
+        tcp_nodelay: bool = True,
+    ) -> None:
+        """subscribe to a topic of any type without decoding the messages
+
+        The callback gets each serialized message, which is only valid during the call, and the connection header of
+        its publisher with the type, md5sum and message_definition.
+        """
+        code, msg, pubs = await self._rpc(self.core, "registerSubscriber", self.name, topic, AnyMsg.__msg_typ__, self.uri)
+        assert code == 1
 
-    def announce(self, topic: str, typ: Type[RosMessage]) -> None:
-        code, msg, subs = self.m.registerPublisher(self.name, topic, typ.__msg_typ__, self.uri) #type: ignore
+        self.callbacks[topic] = (callback, "", "")
+        self.sub_options[topic] = {"raw": True, "shm": shm, "tcp_nodelay": tcp_nodelay}
+        self.local_options[topic] = None
+        self.topic_typ[topic] = AnyMsg
+        self.subs[topic] = {}
+
+        for p in pubs:
+            self.__start_connect(p, topic)
+
+    def subscribe_raw(
+        self,
+        topic: str,
+        callback: Callable[[memoryview, Dict[str, str]], None],
+        shm: bool = False,
+        tcp_nodelay: bool = True,
+    ) -> None:
+        self._sync(self.subscribe_raw_async(topic, callback, shm, tcp_nodelay))
+
+    def __executor(self, topic: str, callback: Callable, executor: str, queue_size: int, latest_only: bool) -> CallbackExecutor:
+        ex: CallbackExecutor
+        if executor == "async":
+            ex = AsyncExecutor(callback, self.loop, queue_size, latest_only, topic)
+        elif executor == "thread":
+            if self.thread_pool is None:
+                self.thread_pool = ThreadPoolExecutor(thread_name_prefix=self.name)
+            ex = PoolExecutor(callback, self.loop, self.thread_pool, queue_size, latest_only, topic)
+        else:
+            if self.process_pool is None:
+                self.process_pool = ProcessPoolExecutor()
+            ex = PoolExecutor(callback, self.loop, self.process_pool, queue_size, latest_only, topic)
+
+        old = self.executors.pop(topic, None)
+        if old is not None:
+            old.close()
+        self.executors[topic] = ex
+        return ex
+
+    async def announce_async(
+        self,
+        topic: str,
+        typ: Type[RosMessage],
+        queue_size: int = 0,
+        shm_size: int = 32 * 1024 * 1024,
+        coalesce_us: Optional[int] = None,
+        latch: bool = False,
+    ) -> None:
+        code, msg, subs = await self._rpc(self.core, "registerPublisher", self.name, topic, typ.__msg_typ__, self.uri)
         self.pubs[topic] = {}
+        self.local_subs[topic] = {}
         self.topic_typ[topic] = typ
+        self.pub_options[topic] = {"queue_size": queue_size, "coalesce_us": coalesce_us, "latch": latch}
+        if latch:
+            self.latched.setdefault(topic, None)
+        else:
+            self.latched.pop(topic, None)
+        self.pub_stats.setdefault(topic, Counters())
+        self.shm_sizes[topic] = shm_size
+
+    def announce(
+        self,
+        topic: str,
+        typ: Type[RosMessage],
+        queue_size: int = 0,
+        shm_size: int = 32 * 1024 * 1024,
+        coalesce_us: Optional[int] = None,
+        latch: bool = False,
+    ) -> None:
+        self._sync(self.announce_async(topic, typ, queue_size, shm_size, coalesce_us, latch))
 
     def run_forever(self) -> None:
         self.loop.run_forever()
 
-    def __delete_pub_serv(self, topic: str, callerid: str) -> None:
-        if callerid in self.pubs[topic]:  # avoid double free
-            del self.pubs[topic][callerid]
+    def __publication(self, topic: str) -> Optional[Tuple[Type[RosMessage], Dict[str, Any]]]:
+        if topic not in self.pubs:
+            return None
+        return self.topic_typ[topic], self.pub_options[topic]
+
+    def __add_pub_serv(self, ps: TCPROSServer) -> None:
+        old = self.pubs[ps.topic].get(ps.callerid)
+        if old is not None:
+            old.transport.close()
+        self.pubs[ps.topic][ps.callerid] = ps
+        self.scheduler.resume(ps.topic)
+
+        frame = self.latched.get(ps.topic)
+        if frame is not None:
+            ps.publish_frame(frame)
+
+    def __delete_pub_serv(self, ps: TCPROSServer) -> None:
+        if self.pubs[ps.topic].get(ps.callerid) is ps:  # avoid double free
+            del self.pubs[ps.topic][ps.callerid]
 
     def publish(self, topic: str, msg: RosMessage) -> None:
-        for ps in self.pubs[topic].values():
-            ps.publish(msg)
+        assert isinstance(msg, self.topic_typ[topic])
+        stats = self.pub_stats[topic]
+        stats.messages += 1
+
+        for client in list(self.local_subs[topic].values()):
+            client.deliver(msg)
+
+        ready = [ps for ps in self.pubs[topic].values() if ps.send_data]
+        if not ready and topic not in self.latched:
+            return
 
-    async def __pub(self, topic: str, rate: int, f: _MSG_FACTORY) -> None:
-        # TODO cancel this coro when no subscriber are there and restart it again later
-        msg = None
+        start = perf_counter_ns()
+        frame = self.converter.encode_frame(msg)
+        end = perf_counter_ns()
+        stats.encode_ns += end - start
+        stats.bytes += len(frame)
+
+        tracer = trace.tracer
+        if tracer is not None:
+            tracer.event("encode", topic, start, end, len(frame))
+        if topic in self.latched:
+            self.latched[topic] = frame
+        for ps in ready:
+            ps.publish_frame(frame)
+
+    def publish_serialized(self, topic: str, data: bytes) -> None:
+        stats = self.pub_stats[topic]
+        stats.messages += 1
+        stats.bytes += len(data) + 4
+
+        if self.local_subs[topic]:
+            msg = self.topic_typ[topic]()
+            self.converter.decode(msg, data)
+            for client in list(self.local_subs[topic].values()):
+                client.deliver(msg)
+
+        ready = [ps for ps in self.pubs[topic].values() if ps.send_data]
+        if not ready and topic not in self.latched:
+            return
 
+        frame = self.converter.frame(data)
+        if topic in self.latched:
+            self.latched[topic] = frame
+        for ps in ready:
+            ps.publish_frame(frame)
+
+    def dropped(self, topic: str) -> Dict[str, int]:
+        """number of messages dropped for each subscriber of a topic because it could not keep up"""
+        return {callerid: ps.dropped for callerid, ps in self.pubs[topic].items()}
+
+    def overruns(self, topic: str) -> int:
+        """number of periods of a scheduled publication which were skipped because the factory or publishing took too long"""
+        return self.scheduler.calls[topic].overruns
+
+    def stats(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """traffic of the published and subscribed topics and their connections
+
+        Returns the topics of "publications" and "subscriptions" with the summed up counters, the dropped and queued
+        messages and a list of their "connections" with the same fields. Bytes include the length prefix of each
+        message, the topics of publications count every message once, independent of the number of subscribers.
+        """
+        pubs: Dict[str, Dict[str, Any]] = {}
+        for topic, servers in self.pubs.items():
+            conns = [
+                _connection(ps.id, ps.callerid, _transport(ps), ps.send_data, ps.stats, ps.dropped, len(ps.queue) + len(ps.pending))
+                for ps in servers.values()
+            ]
+            conns += [
+                _connection(client.id, name, "INTRAPROCESS", True, client.stats, 0, 0)
+                for name, client in self.local_subs[topic].items()
+            ]
+            pubs[topic] = _topic(self.pub_stats[topic], conns)
+
+        subs: Dict[str, Dict[str, Any]] = {}
+        for topic, subscriptions in self.subs.items():
+            total = Counters()
+            conns = []
+            for pub, sub in subscriptions.items():
+                protocol: Any = sub.protocol
+                total.add(protocol.stats)
+                if isinstance(protocol, IntraProcessClient):
+                    conns.append(_connection(protocol.id, pub, "INTRAPROCESS", True, protocol.stats, 0, 0))
+                else:
+                    conns.append(_connection(protocol.id, pub, _transport(protocol), protocol.read_data, protocol.stats, protocol.dropped, 0))
+            subs[topic] = _topic(total, conns)
+
+            # callbacks outside of the event loop are only queued by the connections
+            ex = self.executors.get(topic)
+            if ex is not None:
+                subs[topic]["callback_ns"] = ex.callback_ns
+                subs[topic]["dropped"] += ex.dropped
+                subs[topic]["queue"] += len(ex.pending)
+
+        return {"publications": pubs, "subscriptions": subs}
+
+    def __has_subscribers(self, topic: str) -> bool:
+        return bool(self.pubs[topic] or self.local_subs[topic])
+
+    def schedule_publish(self, topic: str, rate: float, f: _MSG_FACTORY) -> None:
+        """publish the messages created by f with a fixed rate, the factory is not called while nobody subscribes"""
         depends = get_type_hints(f)
         del depends["return"]
 
@@ -173,29 +692,50 @@ class Node(XMLRPCServer):
             else:
                 raise Exception(f"Typ {typ} cant be inserted")
 
-        while self.loop.is_running():
-            args: Dict[str, Any] = {}
-            if include_msg:
-                args[include_msg]  = msg
-            if include_self:
-                args[include_self] = self
+        args: Dict[str, Any] = {}
+        if include_msg:
+            args[include_msg] = None
+        if include_self:
+            args[include_self] = self
 
-            msg = f(**args) #type: ignore
+        def tick() -> None:
+            tracer = trace.tracer
+            if tracer is not None:
+                start = perf_counter_ns()
 
+            msg = f(**args) #type: ignore
+            if include_msg:
+                args[include_msg] = msg
             self.publish(topic, msg)
 
-            await sleep(1.0 / rate)
+            if tracer is not None:
+                tracer.event("tick", topic, start, perf_counter_ns())
 
-    def schedule_publish(self, topic: str, rate: int, f:_MSG_FACTORY):
-        self.loop.create_task(self.__pub(topic, rate, f))
+        self.scheduler.add(topic, 1.0 / rate, tick, lambda: self.__has_subscribers(topic))
 
     # XML node API methods
-    # TODO
-    async def getBusState(self, caller_id: str) -> Tuple[int, str, List[XMLRPCValue]]:
-        ...
-    # TODO
+    async def getBusStats(self, caller_id: str) -> Tuple[int, str, List[XMLRPCValue]]:
+        stats = self.stats()
+        pub_stats = [
+            [topic, s["bytes"], [[c["id"], c["bytes"], c["messages"], c["connected"]] for c in s["connections"]]]
+            for topic, s in stats["publications"].items()
+        ]
+        sub_stats = [
+            [topic, [[c["id"], c["bytes"], c["dropped"], c["connected"]] for c in s["connections"]]]
+            for topic, s in stats["subscriptions"].items()
+        ]
+        # there are no services yet
+        return 1, "OK", [pub_stats, sub_stats, [0, 0, 0]]
+
     async def getBusInfo(self, caller_id: str) -> Tuple[int, str, List[XMLRPCValue]]:
-        ...
+        stats = self.stats()
+        info = []
+        for direction, key in (("o", "publications"), ("i", "subscriptions")):
+            for topic, s in stats[key].items():
+                for c in s["connections"]:
+                    peer = f"{'to' if direction == 'o' else 'from'} {c['destination']}"
+                    info.append([c["id"], c["destination"], direction, c["transport"], topic, c["connected"], f"{c['transport']} connection {peer}"])
+        return 1, "OK", info
     # TODO
     async def getMasterUri(self, caller_id: str) -> Tuple[int, str, str]:
         return (1, "OK", self.core)
@@ -211,41 +751,63 @@ class Node(XMLRPCServer):
 
     async def getPublications(self, caller_id: str) -> Tuple[int, str, List[Tuple[str, str]]]:
         return 1, "OK", [ (topic, self.topic_typ[topic].__msg_typ__) for topic in self.pubs ]
-    # TODO
     async def paramUpdate(self, caller_id: str, key: str, val: XMLRPCValue) -> Tuple[int, str, int]:
-        self.param_callbacks[key](val)
+        self.param._update(key, val)
         return 1, "OK", 0
 
     async def publisherUpdate(self, caller_id: str, topic: str, publisher: List[str]) -> Tuple[int, str, int]:
-        typ = self.topic_typ[topic]
-
-        cur_subs = set(self.subs[topic].keys())
+        if topic not in self.subs:
+            return (0, f"{topic} is not subscribed by {self.name}", 0)
 
+        # the connections are set up concurrently in the background
         for pub in publisher:
-            await self.__subscribe__(pub, topic, typ)
-            if pub in cur_subs:
-                cur_subs.remove(pub)
+            self.__start_connect(pub, topic)
 
-        for dead_pub in cur_subs:
+        for dead_pub in set(self.subs[topic].keys()) - set(publisher):
             self.subs[topic][dead_pub].transport.close()
-            del self.subs[topic][dead_pub].protocol
             del self.subs[topic][dead_pub]
 
+        for (t, pub), task in list(self.connecting.items()):
+            if t == topic and pub not in publisher:
+                task.cancel()
+
         return (1, "OK", 0)
 
-    async def requestTopic(self, caller_id: str, topic: str, protocols: _PROTO_INFO) -> Tuple[int, str, _PROTO_INFO]:
-        print(f"Node {caller_id} wants to get {topic}, creating server for it")
-        ros_server = TCPROSServer(self.topic_typ[topic], self.name, topic, caller_id, self.__delete_pub_serv)
+    async def __udpros(self, caller_id: str, topic: str, header: bytes, host: str, port: int, max_datagram_size: int) -> Tuple[int, str, _PROTO_INFO]:
+        print(f"Node {caller_id} wants to get {topic} over UDP")
+        typ = self.topic_typ[topic]
+        headers = self.converter.decode_header(header)
+        if headers.get("md5sum") not in ("*", typ.__md5_sum__):
+            return (0, f"{headers.get('type')} does not match {typ.__msg_typ__}", [])
+
+        size = min(max_datagram_size, MAX_DATAGRAM_SIZE) if max_datagram_size > 0 else MAX_DATAGRAM_SIZE
+        callerid = headers.get("callerid", caller_id)
+        transport, ps = await self.loop.create_datagram_endpoint(
+            lambda: UDPROSServer(topic, callerid, size, self.__delete_pub_serv),
+            remote_addr=(host, port),
+        )
+        ps.latch = topic in self.latched
+        _, udp_port = transport.get_extra_info("sockname")[:2]
+        reply = self.converter.encode_header(typ, self.name, topic, extra={"latching": "1" if ps.latch else "0"})[4:]
 
-        server = await self.loop.create_server(lambda: ros_server, "0.0.0.0", 0)
-        assert server
+        self.__add_pub_serv(ps)  # type: ignore
+        return (1, f"ready on {self.addr[0]}:{udp_port}", ["UDPROS", self.addr[0], udp_port, ps.id, size, reply])
 
-        _, port = server.sockets[0].getsockname()  # type: ignore
-        self.pubs[topic][caller_id] = ros_server
-        addr, _ = self.addr
+    async def requestTopic(self, caller_id: str, topic: str, protocols: _PROTO_INFO) -> Tuple[int, str, _PROTO_INFO]:
+        if topic not in self.pubs:
+            return (0, f"{topic} is not published by {self.name}", [])
 
-        code = 1
-        msg = "TODO FIXME"
-        proto_params = ["TCPROS", addr, port]
+        addr, _ = self.addr
 
-        return (code, msg, proto_params)
\ No newline at end of file
+        for p in protocols:
+            if p[0] == "UDPROS" and len(p) >= 5:
+                return await self.__udpros(caller_id, topic, *p[1:5])
+            # shared memory only works if the subscriber runs on the same host
+            if p[0] == "SHMROS" and len(p) > 1 and p[1] == addr:
+                print(f"Node {caller_id} wants to get {topic} over shared memory")
+                return (1, f"ready on {addr}:{self.tcpros_port}", ["SHMROS", addr, self.tcpros_port])
+            if p[0] == "TCPROS":
+                print(f"Node {caller_id} wants to get {topic}")
+                return (1, f"ready on {addr}:{self.tcpros_port}", ["TCPROS", addr, self.tcpros_port])
+
+        return (0, "no supported protocol", [])
\ No newline at end of file
@@ -1,37 +1,251 @@
-from typing import Any, Callable
+from collections import OrderedDict
+from copy import deepcopy
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from alpyro.names import ancestors, canonical, related, resolve
+
+# results which are not known locally, and parameters which are known to be not set
+_MISSING = object()
+_NOT_SET = object()
+
+
+def _parts(key: str) -> List[str]:
+    return key.split("/")[1:] if key != "/" else []
+
+
+class ParameterCache:
+    """Results of reads from the parameter server, which are dropped after ttl seconds or when there are more than
+    max_size of them (least recently used first). A ttl of None keeps them until the parameters are changed by this node.
+    """
+    entries: "OrderedDict[Tuple[str, str], Tuple[Any, float]]"
+
+    def __init__(self, ttl: Optional[float] = 1.0, max_size: int = 1024) -> None:
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def get(self, method: str, key: str) -> Any:
+        entry = self.entries.get((method, key))
+        if entry is None:
+            return _MISSING
+
+        value, time = entry
+        if self.ttl is not None and monotonic() - time > self.ttl:
+            del self.entries[(method, key)]
+            return _MISSING
+
+        self.entries.move_to_end((method, key))
+        return value
+
+    def put(self, method: str, key: str, value: Any) -> None:
+        self.entries[(method, key)] = (value, monotonic())
+        self.entries.move_to_end((method, key))
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        """drop the results which can change if key is set or deleted"""
+        for method, k in list(self.entries):
+            if method not in ("get", "has") or related(k, key):
+                del self.entries[(method, k)]
+
 
 class ParameterApi:
+    """Parameter server of the node's master.
+
+    Subscribed parameters, which can be whole namespaces, are kept up to date by the paramUpdate calls of the master
+    and read locally. With enable_cache the other reads are cached for a while as well.
+    """
+    # values of the subscribed parameters by their global name
+    subscribed: Dict[str, Any]
+    cache: Optional[ParameterCache] = None
 
     def __init__(self, node):
         self.node = node
+        self.subscribed = {}
+
+    async def _call(self, method: str, *args: Any):
+        return await self.node._rpc(self.node.core, method, self.node.name, *args)
+
+    def _resolve(self, key: str) -> str:
+        return resolve(self.node.name, key)
+
+    def _cached(self, method: str, key: str) -> Any:
+        """the locally known result of a read, _MISSING if the master has to be asked"""
+        if method in ("get", "has") and self.subscribed:
+            parts = _parts(key)
+            for i, name in enumerate(ancestors(key)):
+                value = self.subscribed.get(name, _MISSING)
+                if value is _MISSING:
+                    continue
+
+                for part in parts[i:]:
+                    if not isinstance(value, dict) or part not in value:
+                        value = _NOT_SET
+                        break
+                    value = value[part]
+
+                if method == "has":
+                    return value is not _NOT_SET
+                return value
+
+        if self.cache is not None:
+            return self.cache.get(method, key)
+        return _MISSING
+
+    def _store(self, method: str, key: str, value: Any) -> None:
+        if self.cache is not None:
+            self.cache.put(method, key, value)
+
+    def _apply(self, key: str, value: Any) -> None:
+        """change a parameter in the subscribed values, value is _NOT_SET if it was deleted"""
+        if self.cache is not None:
+            self.cache.invalidate(key)
+
+        for sub in list(self.subscribed):
+            if sub == key:
+                self.subscribed[sub] = {} if value is _NOT_SET else value
+            elif related(sub, key) and len(sub) < len(key):
+                # the parameter is in a subscribed namespace
+                *path, name = _parts(key)[len(_parts(sub)):]
+                node = self.subscribed[sub]
+                if not isinstance(node, dict):
+                    node = self.subscribed[sub] = {}
+
+                for part in path:
+                    child = node.get(part)
+                    if not isinstance(child, dict):
+                        if value is _NOT_SET:
+                            break
+                        child = node[part] = {}
+                    node = child
+                else:
+                    if value is _NOT_SET:
+                        node.pop(name, None)
+                    else:
+                        node[name] = value
+            elif related(sub, key):
+                # the subscribed parameter is in the changed namespace
+                for part in _parts(sub)[len(_parts(key)):]:
+                    if not isinstance(value, dict) or part not in value:
+                        value = _NOT_SET
+                        break
+                    value = value[part]
+                self.subscribed[sub] = {} if value is _NOT_SET else deepcopy(value)
+
+    def _update(self, key: str, value: Any) -> None:
+        """paramUpdate of the master, the callbacks get the new value of their subscribed key"""
+        # rosmaster sends the keys with a trailing slash
+        key = canonical(key)
+        self._apply(key, value)
+        for sub in list(self.subscribed):
+            callback = self.node.param_callbacks.get(sub)
+            if callback is not None and related(sub, key):
+                callback(deepcopy(self.subscribed[sub]))
+
+    def enable_cache(self, ttl: Optional[float] = 1.0, max_size: int = 1024) -> None:
+        """cache the results of reads of parameters which are not subscribed"""
+        self.cache = ParameterCache(ttl, max_size)
+
+    async def delete_async(self, key: str) -> None:
+        key = self._resolve(key)
+        code, msg, value = await self._call("deleteParam", key)
+        self._apply(key, _NOT_SET)
+
+    async def set_async(self, key: str, value: Any) -> None:
+        key = self._resolve(key)
+        code, msg, _ = await self._call("setParam", key, value)
+        self._apply(key, deepcopy(value))
+
+    async def get_async(self, key: str):
+        key = self._resolve(key)
+        value = self._cached("get", key)
+        if value is _MISSING:
+            code, msg, value = await self._call("getParam", key)
+            if code != 1:
+                value = _NOT_SET
+            self._store("get", key, value)
+        return None if value is _NOT_SET else value
+
+    async def search_async(self, key: str):
+        value = self._cached("search", key)
+        if value is _MISSING:
+            code, msg, value = await self._call("searchParam", key)
+            if code != 1:
+                value = None
+            self._store("search", key, value)
+        return value
+
+    async def subscribe_async(self, key: str, callback: Optional[Callable] = None):
+        key = self._resolve(key)
+        code, msg, value = await self._call("subscribeParam", self.node.uri, key)
+        self.subscribed[key] = value if code == 1 else {}
+        if callback is not None:
+            self.node.param_callbacks[key] = callback
+        return value if code == 1 else None
+
+    async def prefetch_async(self, namespace: str) -> None:
+        """subscribe to a namespace, so all its parameters are read locally"""
+        await self.subscribe_async(namespace)
+
+    async def unsubscribe_async(self, key: str) -> None:
+        key = self._resolve(key)
+        code, msg, value = await self._call("unsubscribeParam", self.node.uri, key)
+        self.subscribed.pop(key, None)
+        self.node.param_callbacks.pop(key, None)
+
+    async def contains_async(self, key: str) -> bool:
+        key = self._resolve(key)
+        value = self._cached("has", key)
+        if value is _MISSING:
+            code, msg, value = await self._call("hasParam", key)
+            value = bool(value)
+            self._store("has", key, value)
+        return value
+
+    async def names_async(self) -> List[str]:
+        value = self._cached("names", "")
+        if value is _MISSING:
+            code, msg, value = await self._call("getParamNames")
+            self._store("names", "", value)
+        return value
 
     def __delitem__(self, key: str):
-        code, msg, value = self.node.m.deleteParam(self.node.name, key)
+        self.node._sync(self.delete_async(key))
 
     def __setitem__(self, key:str, value: Any):
-        code, msg, value = self.node.m.setParam(self.node.name, key, value)
+        self.node._sync(self.set_async(key, value))
 
+    # reads which are known locally don't need to run the event loop
     def __getitem__(self, key: str):
-        code, msg, value = self.node.m.getParam(self.node.name, key)
-        return value if code == 1 else None
+        value = self._cached("get", self._resolve(key))
+        if value is not _MISSING:
+            return None if value is _NOT_SET else value
+        return self.node._sync(self.get_async(key))
 
     def search(self, key:str):
-        code, msg, value = self.node.m.searchParam(self.node.name, key)
-        return value if code == 1 else None
+        value = self._cached("search", key)
+        if value is not _MISSING:
+            return value
+        return self.node._sync(self.search_async(key))
 
-    def subscribe(self, key: str, callback: Callable):
-        code, msg, value = self.node.m.subscribeParam(self.node.name, self.node.uri, key)
-        self.node.param_callbacks[key] = callback
-        return value if code == 1 else None
+    def subscribe(self, key: str, callback: Optional[Callable] = None):
+        return self.node._sync(self.subscribe_async(key, callback))
+
+    def prefetch(self, namespace: str) -> None:
+        self.node._sync(self.prefetch_async(namespace))
 
     def unsubscribe(self, key: str) -> None:
-        code, msg, value = self.node.m.unsubscribeParam(self.node.name, self.node.uri, key)
-        del self.node.param_callbacks[key]
+        self.node._sync(self.unsubscribe_async(key))
 
     def __contains__(self, key: str):
-        code, msg, value = self.node.m.hasParam(self.node.name, key)
-        return bool(value)
+        value = self._cached("has", self._resolve(key))
+        if value is not _MISSING:
+            return value
+        return self.node._sync(self.contains_async(key))
 
     def __iter__(self):
-        code, msg, value = self.node.m.getParamNames(self.node.name)
+        value = self._cached("names", "")
+        if value is _MISSING:
+            value = self.node._sync(self.names_async())
         yield from value
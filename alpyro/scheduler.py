@@ -0,0 +1,131 @@
+import asyncio
+import heapq
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class ScheduledCall:
+    key: str
+    period: float
+    callback: Callable[[], None]
+    # returns False if the call should be paused, e.g. a topic without subscribers
+    active: Callable[[], bool]
+
+    deadline: float = 0.0
+    paused: bool = False
+    # number of deadlines which were skipped because the previous call finished too late
+    overruns: int = 0
+    calls: int = 0
+
+    def __init__(self, key: str, period: float, callback: Callable[[], None], active: Callable[[], bool]) -> None:
+        self.key = key
+        self.period = period
+        self.callback = callback
+        self.active = active
+
+
+class Scheduler:
+    """Calls functions periodically with a single timer of the event loop.
+
+    Deadlines are absolute multiples of the period on the loop's clock, so the rate doesn't drift with the time the
+    calls take and calls with the same or commensurable periods are run in the same tick.
+    """
+    loop: asyncio.AbstractEventLoop
+    calls: Dict[str, ScheduledCall]
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.calls = {}
+        self._heap: List[Tuple[float, int, ScheduledCall]] = []
+        self._counter = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def add(self, key: str, period: float, callback: Callable[[], None], active: Callable[[], bool] = lambda: True) -> ScheduledCall:
+        assert period > 0
+        self.remove(key)
+
+        call = ScheduledCall(key, period, callback, active)
+        self.calls[key] = call
+        if active():
+            self._push(call, self._next_deadline(period))
+        else:
+            call.paused = True
+        return call
+
+    def remove(self, key: str) -> None:
+        call = self.calls.pop(key, None)
+        if call is not None:
+            # entries in the heap are skipped once they are not in calls anymore
+            call.paused = True
+
+    def resume(self, key: str) -> None:
+        call = self.calls.get(key)
+        if call is None or not call.paused:
+            return
+
+        call.paused = False
+        self._push(call, self._next_deadline(call.period))
+
+    def close(self) -> None:
+        self.calls.clear()
+        self._heap.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _next_deadline(self, period: float) -> float:
+        return math.ceil(self.loop.time() / period) * period
+
+    def _push(self, call: ScheduledCall, deadline: float) -> None:
+        call.deadline = deadline
+        self._counter += 1
+        heapq.heappush(self._heap, (deadline, self._counter, call))
+
+        if self._timer is None or deadline < self._timer.when():
+            self._arm()
+
+    def _arm(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._heap:
+            self._timer = self.loop.call_at(self._heap[0][0], self._tick)
+
+    def _tick(self) -> None:
+        self._timer = None
+        now = self.loop.time()
+
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+
+        for call in due:
+            if call.paused or self.calls.get(call.key) is not call:
+                continue
+            if not call.active():
+                call.paused = True
+                continue
+
+            try:
+                call.callback()
+            except Exception as e:
+                self.loop.call_exception_handler({
+                    "message": f"Exception in scheduled call {call.key}",
+                    "exception": e,
+                })
+            call.calls += 1
+
+            # a call which is late by less than a period is caught up in the next tick, the loop's timers have only
+            # millisecond resolution
+            deadline = call.deadline + call.period
+            now = self.loop.time()
+            if now - deadline >= call.period:
+                missed = math.floor((now - deadline) / call.period)
+                call.overruns += missed
+                deadline += missed * call.period
+
+            call.deadline = deadline
+            self._counter += 1
+            heapq.heappush(self._heap, (deadline, self._counter, call))
+
+        self._arm()
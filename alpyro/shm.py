@@ -0,0 +1,126 @@
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from struct import Struct
+from typing import Optional, Set, Tuple
+
+# capacity of the ring and the end of the area reserved by the writer, counted in bytes since the ring was created
+_RING_HEADER = Struct("<QQ")
+_RESERVED = Struct("<Q")
+_RESERVED_OFFSET = 8
+_DATA_OFFSET = 64
+
+_UINT32 = Struct("<I")
+
+# segments created by this process, the resource tracker of the process already knows them
+_OWN_SEGMENTS: Set[str] = set()
+
+# every frame on a shared memory connection starts with a tag, inline frames carry the message after it
+INLINE = 0
+SHARED = 1
+# tag, sequence number, position and length of the message in the ring
+_NOTIFICATION = Struct("<BQQI")
+
+
+class ShmWriter:
+    """Ring buffer in shared memory for the messages of one topic, written once for all subscribers on the host.
+
+    The subscribers only get a small notification over their TCPROS connection.
+    Messages larger than half of the ring are sent inline instead.
+    """
+    shm: SharedMemory
+    capacity: int
+
+    def __init__(self, capacity: int) -> None:
+        self.shm = SharedMemory(create=True, size=_DATA_OFFSET + capacity)
+        self.capacity = capacity
+        _OWN_SEGMENTS.add(self.shm.name)
+        self.pos = 0
+        self.seq = 0
+        _RING_HEADER.pack_into(self.shm.buf, 0, capacity, 0)
+
+        self.frame: Optional[bytes] = None
+        self.notification = b""
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, frame: bytes) -> bytes:
+        """copy an encoded message with its length prefix into the ring and return the frame for the subscribers"""
+        # the same frame is published to all connections of the topic, but has to be written only once
+        if frame is self.frame:
+            return self.notification
+
+        data = memoryview(frame)[4:]
+        l = len(data)
+
+        if l > self.capacity // 2:
+            notification = _UINT32.pack(l + 1) + bytes((INLINE,)) + data
+        else:
+            pos = self.pos
+            if pos % self.capacity + l > self.capacity:
+                pos += self.capacity - pos % self.capacity
+
+            # readers check the reserved end to detect that the message they read was overwritten
+            _RESERVED.pack_into(self.shm.buf, _RESERVED_OFFSET, pos + l)
+            offset = _DATA_OFFSET + pos % self.capacity
+            self.shm.buf[offset : offset + l] = data
+
+            self.pos = pos + l
+            self.seq += 1
+            notification = _UINT32.pack(_NOTIFICATION.size) + _NOTIFICATION.pack(SHARED, self.seq, pos, l)
+
+        self.frame = frame
+        self.notification = notification
+        return notification
+
+    def close(self) -> None:
+        _OWN_SEGMENTS.discard(self.shm.name)
+        self.shm.close()
+        self.shm.unlink()
+
+
+class ShmReader:
+    shm: SharedMemory
+    capacity: int
+    # messages which were overwritten before they could be read or were dropped by the publisher
+    dropped: int = 0
+
+    def __init__(self, name: str) -> None:
+        self.shm = SharedMemory(name)
+        # the segment belongs to the publisher, it must not be unlinked when this process exits
+        if self.shm.name not in _OWN_SEGMENTS:
+            resource_tracker.unregister(self.shm._name, "shared_memory")  # type: ignore[attr-defined]
+        self.capacity, _ = _RING_HEADER.unpack_from(self.shm.buf, 0)
+        self.seq = 0
+
+    def read(self, frame: memoryview) -> Tuple[Optional[memoryview], int]:
+        """message and its position in the ring for a received frame, the message is None if it was overwritten"""
+        if frame[0] == INLINE:
+            return frame[1:], -1
+
+        _, seq, pos, l = _NOTIFICATION.unpack_from(frame)
+        if self.seq and seq > self.seq + 1:
+            self.dropped += seq - self.seq - 1
+        self.seq = seq
+
+        if not self.valid(pos):
+            self.dropped += 1
+            return None, pos
+
+        offset = _DATA_OFFSET + pos % self.capacity
+        return self.shm.buf[offset : offset + l], pos
+
+    def valid(self, pos: int) -> bool:
+        """check that the message at this position was not overwritten yet"""
+        if pos < 0:
+            return True
+        reserved, = _RESERVED.unpack_from(self.shm.buf, _RESERVED_OFFSET)
+        return reserved <= pos + self.capacity
+
+    def close(self) -> None:
+        try:
+            self.shm.close()
+        except BufferError:
+            # messages decoded with views still reference the segment
+            pass
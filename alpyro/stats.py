@@ -0,0 +1,32 @@
+from itertools import count
+from typing import Dict
+
+_CONNECTION_IDS = count(1)
+
+
+def connection_id() -> int:
+    """unique id of a connection within this process, as reported by getBusInfo"""
+    return next(_CONNECTION_IDS)
+
+
+class Counters:
+    """Traffic of a topic or of one connection.
+
+    The counters are updated for every message, so they are only int additions on a slotted object.
+    The times are summed up nanoseconds of perf_counter_ns.
+    """
+    __slots__ = ("messages", "bytes", "encode_ns", "decode_ns", "callback_ns")
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.bytes = 0
+        self.encode_ns = 0
+        self.decode_ns = 0
+        self.callback_ns = 0
+
+    def add(self, other: "Counters") -> None:
+        for name in self.__slots__:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
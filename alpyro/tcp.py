@@ -1,120 +1,63 @@
-from asyncio import Protocol
-import struct
-from typing import Dict, Optional, Type, Final, Any
-from alpyro_msgs import  Duration, RosMessage, Time, Converter
-from typing_extensions import Annotated, get_type_hints
-from typing_extensions import get_args, get_origin  # type: ignore[attr-defined]
+from asyncio import AbstractEventLoop, BufferedProtocol, Handle, Protocol, get_event_loop
+from collections import deque
+from socket import IPPROTO_TCP, TCP_NODELAY
+from struct import Struct
+from time import perf_counter_ns
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Type
+from alpyro_msgs import RosMessage, Converter
+from alpyro import trace
+from alpyro.codec import get_codec
+from alpyro.shm import ShmReader, ShmWriter
+from alpyro.stats import Counters, connection_id
 
-class TCPROSConverter:
-    def _decode_value(self, msg: RosMessage, buffer: bytes, offset, typ):
-        o = get_origin(typ)
-        val: Any = None
-
-        if o is None and issubclass(typ, RosMessage):
-            val = typ()
-            offset = self.decode(val, buffer, offset)
-            return val, offset
-
-        base, size, signed = get_args(typ)
-
-        if base == str:
-            l = int.from_bytes(buffer[offset : offset + 4], "little", signed=False)
-            val = buffer[offset + 4 : offset + 4 + l].decode("utf-8")
-            offset += 4 + l
-        elif base == int:
-            val = int.from_bytes(buffer[offset : offset + size], "little", signed=signed)
-            offset += size
-        elif base == float:
-            val, *_ = struct.unpack("<f" if size == 4 else "<d", buffer[offset : offset + size])
-            offset += size
-        elif base == bytes:
-            if size == 0:
-                size = int.from_bytes(buffer[offset : offset + 4], "little", signed=False)
-                offset += 4
-            val = buffer[offset : offset + size]
-            offset += size
-        elif base == Time or base == Duration:
-            secs = int.from_bytes(buffer[offset : offset + 4], "little", signed=False)
-            nsecs = int.from_bytes(buffer[offset + 4 : offset + 8], "little", signed=False)
-            val = base(secs, nsecs)
-            offset += 8
-        elif get_origin(base) == list:
-            t, *_ = get_args(base)
-            if size == 0:
-                size = int.from_bytes(buffer[offset : offset + 4], "little", signed=False)
-                offset += 4
-
-            val = []
-            for _ in range(size):
-                v, offset = self._decode_value(msg, buffer, offset, t)
-                val.append(v)
-
-        return val, offset
+_UINT32 = Struct("<I")
 
-    def decode(self, msg: RosMessage, buffer: bytes, offset: int = 0) -> int:
-        for name, t in get_type_hints(msg, include_extras=True).items():  # type: ignore
-            if get_origin(t) is Final:
-                continue
-            val, offset = self._decode_value(msg, buffer, offset, t)
-            setattr(msg, name, val)
-        return offset
-
-    def _encode_value(self, val: Any, typ: Type[Any], buffer: bytearray) -> None:
-        if isinstance(val, RosMessage):
-            self.encode(val, buffer)
-            return
+# size of the per connection receive buffer, larger frames are received into their own buffer
+_CHUNK_SIZE = 64 * 1024
 
-        o = get_origin(typ)
-
-        assert o == Annotated
-        base, size, signed = get_args(typ)
-
-        if base == str:
-            buffer.extend(len(val).to_bytes(4, "little", signed=False))
-            buffer.extend(val.encode("utf-8"))
-        elif base == int:
-            buffer.extend(val.to_bytes(size, "little", signed=signed))
-        elif base == float:
-            buffer.extend(struct.pack("<f" if size == 4 else "<d", val))
-        elif base == bytes:
-            if size == 0:
-                byte_length = len(val)
-                buffer.extend(byte_length.to_bytes(4, "little", signed=False))
-            else:
-                assert len(val) == size
-            buffer.extend(val)
-        elif base == Time or base == Duration:
-            buffer.extend(val.secs.to_bytes(4, "little", signed=False))
-            buffer.extend(val.nsecs.to_bytes(4, "little", signed=False))
-        elif get_origin(base) == list:
-            typ, *_ = get_args(base)
-
-            if size == 0:
-                byte_length = len(val)
-                buffer.extend(byte_length.to_bytes(4, "little", signed=False))
-            else:
-                assert len(val) == size
-            for v in val:
-                self._encode_value(v, typ, buffer)
 
-    def encode(self, msg: RosMessage, buffer: Optional[bytearray] = None) -> bytearray:
-        if buffer is None:
-            buffer = bytearray()
+class AnyMsg(RosMessage):
+    """Placeholder type to subscribe to a topic of any type, the messages are passed on serialized"""
+    __msg_typ__ = "*"
+    __md5_sum__ = "*"
+    __msg_def__ = ""
+
 
-        for name, t in get_type_hints(msg, include_extras=True).items():  # type: ignore
-            origin = get_origin(t)
+def _set_nodelay(transport, nodelay: bool) -> None:
+    sock = transport.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, int(nodelay))
 
-            if origin is Final:
-                continue
 
-            def_factory = t
-            if origin is Annotated and get_origin(get_args(t)[0]) is list:
-                def_factory = list
+class TCPROSConverter:
+    arrays: bool
+    views: bool
+
+    def __init__(self, arrays: bool = False, views: bool = False) -> None:
+        self.arrays = arrays
+        self.views = views
+
+    def decode(self, msg: RosMessage, buffer: bytes, offset: int = 0) -> int:
+        return get_codec(type(msg), self.arrays, self.views).decode(msg, buffer, offset)
+
+    def encode(self, msg: RosMessage, buffer: Optional[bytearray] = None) -> bytearray:
+        return get_codec(type(msg)).encode(msg, buffer)
+
+    def decode_into(self, msg: RosMessage, buffer: bytes, offset: int = 0) -> int:
+        """decode into a previously decoded message, reusing its nested messages"""
+        return get_codec(type(msg), self.arrays, self.views).decode_into(msg, buffer, offset)
 
-            val = getattr(msg, name, def_factory())
-            self._encode_value(val, t, buffer)
+    def encode_frame(self, msg: RosMessage) -> bytearray:
+        """encode a message including the length prefix, the frame must not be changed after it was published"""
+        buffer = bytearray(4)
+        get_codec(type(msg)).encode(msg, buffer)
+        _UINT32.pack_into(buffer, 0, len(buffer) - 4)
         return buffer
 
+    def frame(self, data: bytes) -> bytes:
+        """add the length prefix to an already serialized message"""
+        return _UINT32.pack(len(data)) + data
+
     def encode_header(self, cls: Type[RosMessage], caller_id: str, topic: str, extra: Optional[Dict[str, str]] = None):
         msg = {
             "message_definition": cls.get_msg_def(),
@@ -137,6 +80,7 @@ class TCPROSConverter:
         return len(b).to_bytes(4, "little", signed=False) + b
 
     def decode_header(self, headers: bytes) -> Dict[str, str]:
+        headers = bytes(headers)
         cur = 0
         rcv_headers: Dict[str, str] = {}
         while cur < len(headers):
@@ -150,42 +94,228 @@ class TCPROSConverter:
         return rcv_headers
 
 
+class FrameReader:
+    """Splits a TCPROS stream into its length prefixed frames, the connection header and the messages.
+
+    Protocols receive directly into get_buffer and call updated, or pass received data to feed. Frames can be split
+    into any number of chunks, including their length prefix, and a chunk can contain many frames. Small frames are
+    views of the receive buffer which are only valid during on_frame, with keep_frames each frame gets its own buffer.
+    """
+
+    def __init__(self, on_frame: Callable[[memoryview], None], keep_frames: bool = False) -> None:
+        self.on_frame = on_frame
+        self.keep_frames = keep_frames
+
+        # small frames are parsed directly from this buffer, data between start and end is not processed yet
+        self.buffer = bytearray(_CHUNK_SIZE)
+        self.start = 0
+        self.end = 0
+
+        # larger frames are received directly into their own buffer, frame_len is 0 if there is no such frame
+        self.frame: Optional[bytearray] = None
+        self.frame_len = 0
+        self.frame_pos = 0
+
+    def get_buffer(self) -> memoryview:
+        if self.frame_len:
+            return memoryview(self.frame)[self.frame_pos : self.frame_len]  # type: ignore
+
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.start > 0:
+            rest = self.end - self.start
+            self.buffer[:rest] = self.buffer[self.start : self.end]
+            self.start, self.end = 0, rest
+
+        return memoryview(self.buffer)[self.end :]
+
+    def updated(self, nbytes: int) -> None:
+        """nbytes were written into the buffer returned by get_buffer"""
+        if self.frame_len:
+            self.frame_pos += nbytes
+            if self.frame_pos == self.frame_len:
+                frame = memoryview(self.frame)[: self.frame_len]  # type: ignore
+                self.frame_len = 0
+                if self.keep_frames:
+                    self.frame = None
+                self.on_frame(frame)
+            return
+
+        self.end += nbytes
+        self._parse()
+
+    def feed(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            buffer = self.get_buffer()
+            n = min(len(buffer), len(view))
+            buffer[:n] = view[:n]
+            view = view[n:]
+            self.updated(n)
+
+    def _parse(self) -> None:
+        view = memoryview(self.buffer)
+
+        while self.end - self.start >= 4:
+            l, = _UINT32.unpack_from(self.buffer, self.start)
+            begin = self.start + 4
+            available = self.end - begin
+
+            if available >= l:
+                self.start = begin + l
+                frame = view[begin : begin + l]
+                # the receive buffer will be overwritten by the next read
+                self.on_frame(memoryview(bytearray(frame)) if self.keep_frames else frame)
+            elif 4 + l > len(self.buffer):
+                if self.frame is None or len(self.frame) < l:
+                    self.frame = bytearray(l)
+                self.frame[:available] = view[begin : self.end]
+                self.frame_len = l
+                self.frame_pos = available
+                self.start = self.end = 0
+                return
+            else:
+                return
+
+
+# returns the message type and the options of a published topic, None if the topic is not published
+_PUBLICATION_LOOKUP = Callable[[str], Optional[Tuple[Type[RosMessage], Dict[str, Any]]]]
+
+
 class TCPROSServer(Protocol):
+    """One connection to a subscriber, accepted by the shared TCPROS listener of a node.
+
+    The topic of the connection is only known after the connection header of the subscriber is received.
+    """
     typ: Type[RosMessage]
     name: str
-    topic: str
+    topic: str = ""
     send_data: bool = False
-    callerid: str
+    callerid: str = ""
     converter: Converter
 
-    def __init__(self, typ: Type[RosMessage], name: str, topic: str, callerid: str, f):
+    # frames waiting while the transport is paused, the oldest ones are dropped if the queue is full
+    queue: Deque[bytes]
+    paused: bool = False
+    dropped: int = 0
+    # the node sends the last message of latched topics after the header
+    latch: bool = False
+
+    # ring buffer for subscribers which requested shared memory
+    shm: Optional[ShmWriter] = None
+
+    # frames published within this many seconds are sent with one write, None to write every frame immediately
+    coalesce: Optional[float] = None
+    pending: List[bytes]
+    flush_handle: Optional[Handle] = None
+    loop: AbstractEventLoop
+
+    # messages and bytes published to this subscriber, including the length prefix of each message
+    stats: Counters
+    id: int
+
+    def __init__(
+        self,
+        name: str,
+        lookup: _PUBLICATION_LOOKUP,
+        connected: Callable[["TCPROSServer"], None],
+        disconnected: Callable[["TCPROSServer"], None],
+        shm_writer: Optional[Callable[[str], ShmWriter]] = None,
+    ):
         super().__init__()
-        self.typ = typ
         self.name = name
-        self.topic = topic
-        self.callerid = callerid
-        self.f = f
+        self.lookup = lookup
+        self.connected = connected
+        self.disconnected = disconnected
+        self.shm_writer = shm_writer
         self.converter = TCPROSConverter()
+        self.queue = deque()
+        self.pending = []
+        self.stats = Counters()
+        self.id = connection_id()
+        self.reader = FrameReader(self._header_received)
 
     def connection_made(self, transport):
         self.transport = transport
 
+    def _configure(self, queue_size: int = 0, coalesce_us: Optional[int] = None, latch: bool = False):
+        self.queue = deque(maxlen=queue_size if queue_size > 0 else None)
+        self.latch = latch
+        if coalesce_us is not None:
+            self.coalesce = coalesce_us / 1e6
+            self.loop = get_event_loop()
+
+    def _error(self, msg: str):
+        print(f"Rejecting subscriber {self.callerid} of {self.topic}: {msg}")
+        m = f"error={msg}".encode("utf-8")
+        self.transport.write(_UINT32.pack(len(m) + 4) + _UINT32.pack(len(m)) + m)
+        self.transport.close()
+
     def data_received(self, data):
-        data_length = int.from_bytes(data[:4], "little", signed=False)
-        # TODO handle cases where not all date in received here?
-        headers = self.converter.decode_header(data[4:])
+        # subscribers only send their connection header
+        if not self.send_data and not self.transport.is_closing():
+            self.reader.feed(data)
 
-        assert headers["md5sum"] == "*" or headers["md5sum"] == self.typ.__md5_sum__
-        assert headers["type"] == "*" or headers["type"] == self.typ.__msg_typ__
+    def _header_received(self, frame: memoryview):
+        if self.send_data or self.transport.is_closing():
+            return
 
-        send_headers = self.converter.encode_header(self.typ, self.name, self.topic, extra ={"latching": "0"})
+        headers = self.converter.decode_header(frame)
+
+        self.topic = headers.get("topic", "")
+        self.callerid = headers.get("callerid", "")
+
+        publication = self.lookup(self.topic)
+        if publication is None:
+            self._error(f"topic {self.topic} is not published by {self.name}")
+            return
+
+        self.typ, options = publication
+        self._configure(**options)
+
+        if headers.get("md5sum") not in ("*", self.typ.__md5_sum__) or headers.get("type") not in ("*", self.typ.__msg_typ__):
+            self._error(f"{headers.get('type')} does not match {self.typ.__msg_typ__}")
+            return
+
+        if "tcp_nodelay" in headers:
+            _set_nodelay(self.transport, headers["tcp_nodelay"] == "1")
+
+        extra = {"latching": "1" if self.latch else "0"}
+        if headers.get("shm") == "1" and self.shm_writer is not None:
+            self.shm = self.shm_writer(self.topic)
+            extra["shm_name"] = self.shm.name
+
+        send_headers = self.converter.encode_header(self.typ, self.name, self.topic, extra=extra)
 
         self.transport.write(send_headers)
         self.send_data = True
+        self.connected(self)
 
     def connection_lost(self, exc):
-        self.f(self.topic, self.callerid)
+        if self.send_data:
+            self.disconnected(self)
         self.send_data = False
+        self.queue.clear()
+        self.pending.clear()
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    def pause_writing(self):
+        self.paused = True
+        # coalesced frames go before the ones published while paused
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        frames, self.pending = self.pending, []
+        for frame in frames:
+            self._enqueue(frame)
+
+    def resume_writing(self):
+        self.paused = False
+        # writing can pause the transport again
+        while self.queue and not self.paused:
+            self.transport.write(self.queue.popleft())
 
     # TODO static type checking for this method?
     def publish(self, msg: RosMessage):
@@ -194,70 +324,209 @@ class TCPROSServer(Protocol):
 
         assert isinstance(msg, self.typ)
 
-        data = self.converter.encode(msg)
-        data_len = bytearray(len(data).to_bytes(4, "little", signed=False))
-
-        data_len.extend(data)
+        tracer = trace.tracer
+        if tracer is None:
+            self.publish_frame(self.converter.encode_frame(msg))
+            return
 
-        self.transport.write(data_len)
+        start = perf_counter_ns()
+        frame = self.converter.encode_frame(msg)
+        tracer.event("encode", self.topic, start, perf_counter_ns(), len(frame))
+        self.publish_frame(frame)
 
+    def publish_frame(self, frame: bytes):
+        """send an encoded message including its length prefix, the frame is shared between connections"""
+        if self.send_data is False:
+            return
 
-class TCPROSClient(Protocol):
-    def __init__(self, callback, typ, name, topic, arg_name_msg, arg_name_node, node):
+        self.stats.messages += 1
+        self.stats.bytes += len(frame)
+        tracer = trace.tracer
+        if tracer is not None:
+            start = perf_counter_ns()
+            size = len(frame)
+
+        if self.shm is not None:
+            frame = self.shm.write(frame)
+
+        if self.paused:
+            self._enqueue(frame)
+        elif self.coalesce is not None:
+            self.pending.append(frame)
+            if self.flush_handle is None:
+                if self.coalesce > 0:
+                    self.flush_handle = self.loop.call_later(self.coalesce, self.flush)
+                else:
+                    self.flush_handle = self.loop.call_soon(self.flush)
+        else:
+            self.transport.write(frame)
+
+        if tracer is not None:
+            tracer.event("write", self.topic, start, perf_counter_ns(), size)
+
+    def _enqueue(self, frame: bytes):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(frame)
+
+    def flush(self):
+        """write the coalesced frames with a single vectored write"""
+        self.flush_handle = None
+        frames, self.pending = self.pending, []
+        if self.paused:
+            for frame in frames:
+                self._enqueue(frame)
+        elif frames:
+            tracer = trace.tracer
+            if tracer is None:
+                self.transport.writelines(frames)
+                return
+
+            start = perf_counter_ns()
+            self.transport.writelines(frames)
+            tracer.event("flush", self.topic, start, perf_counter_ns(), sum(len(f) for f in frames))
+
+
+class TCPROSClient(BufferedProtocol):
+    def __init__(
+        self,
+        callback,
+        typ,
+        name,
+        topic,
+        arg_name_msg,
+        arg_name_node,
+        node,
+        arrays=False,
+        views=False,
+        lazy=False,
+        shm=False,
+        tcp_nodelay=True,
+        reuse=False,
+        raw=False,
+    ):
         self.callback = callback
         self.typ = typ
         self.name = name
         self.topic = topic
         self.read_data = False
-        self.converter = TCPROSConverter()
-        self.current_buffer = None
-        self.msg_len = 0
+        self.converter = TCPROSConverter(arrays, views)
         self.arg_name_msg = arg_name_msg
         self.arg_name_node = arg_name_node
         self.node = node
+        self.lazy_typ = get_codec(typ, arrays, views).lazy_type() if lazy else None
+        self.request_shm = shm
+        self.tcp_nodelay = tcp_nodelay
+        self.shm: Optional[ShmReader] = None
+        # connection header of the publisher
+        self.headers: Dict[str, str] = {}
+        self.stats = Counters()
+        self.id = connection_id()
+
+        # raw callbacks get the serialized message, which is only valid during the call, and the connection header
+        self.raw = raw
+
+        # with reuse every message is decoded into the same instance, which is only valid during the callback
+        assert not (reuse and lazy)
+        self.msg: Optional[RosMessage] = typ() if reuse else None
+        self.args: Dict[str, Any] = {arg_name_msg: self.msg}
+        if arg_name_node:
+            self.args[arg_name_node] = node
+
+        # decoded messages can reference the frame they were decoded from, so such frames can't be reused
+        self.keep_frames = arrays or views or lazy
+        self.reader = FrameReader(self._frame_finished, self.keep_frames)
 
     def connection_made(self, transport):
-        transport.write(self.converter.encode_header(self.typ, self.name, self.topic))
+        extra = {"tcp_nodelay": "1" if self.tcp_nodelay else "0"}
+        if self.request_shm:
+            extra["shm"] = "1"
+        _set_nodelay(transport, self.tcp_nodelay)
+        transport.write(self.converter.encode_header(self.typ, self.name, self.topic, extra=extra))
 
-    def _msg_finished(self):
-        ins = self.typ()
-        self.converter.decode(ins, self.current_buffer, 0)
-        args = {self.arg_name_msg: ins}
-        if self.arg_name_node:
-            args[self.arg_name_node] = self.node
-        self.callback(**args)
-        self.current_buffer = None
-
-    def _build_msg(self, data: bytes):
-        if self.current_buffer is None:
-            data_length = int.from_bytes(data[:4], "little", signed=False)
-            self.msg_len = data_length
-            self.current_buffer = bytes()
-            data = data[4:]
-
-        missing_len = self.msg_len - len(self.current_buffer)
-
-        if len(data) < missing_len:
-            self.current_buffer += (data)
-        elif len(data) == missing_len:
-            self.current_buffer += (data)
-            self._msg_finished()
-        else:
-            self.current_buffer += (data[:missing_len])
-            self._msg_finished()
-            self._build_msg(data[missing_len:])
+    def get_buffer(self, sizehint):
+        return self.reader.get_buffer()
 
-    def data_received(self, data):
+    def buffer_updated(self, nbytes):
+        tracer = trace.tracer
+        if tracer is not None:
+            now = perf_counter_ns()
+            tracer.event("receive", self.topic, now, now, nbytes)
+
+        self.reader.updated(nbytes)
+
+    def _frame_finished(self, frame: memoryview):
         if self.read_data:
-            self._build_msg(data)
-        else:
-            data_length = int.from_bytes(data[:4], "little", signed=False)
-            headers = self.converter.decode_header(data[4:])
+            self._msg_finished(frame)
+            return
+
+        headers = self.converter.decode_header(frame)
 
+        if self.typ.__md5_sum__ != "*":
             assert headers["md5sum"] == self.typ.__md5_sum__
             assert headers["type"] == self.typ.__msg_typ__
-            self.read_data = True
+        self.headers = headers
+        if "shm_name" in headers:
+            self.shm = ShmReader(headers["shm_name"])
+        self.read_data = True
+
+    def _decode(self, frame: memoryview) -> Any:
+        if self.raw:
+            return frame
+        if self.lazy_typ is not None:
+            return self.lazy_typ(frame)
+        if self.msg is not None:
+            self.converter.decode_into(self.msg, frame, 0)
+            return self.msg
+
+        ins = self.typ()
+        self.converter.decode(ins, frame, 0)
+        return ins
+
+    def _msg_finished(self, frame: memoryview):
+        stats = self.stats
+        start = perf_counter_ns()
+        if self.shm is None:
+            ins = self._decode(frame)
+            size = len(frame)
+        else:
+            data, pos = self.shm.read(frame)
+            if data is None:
+                return
+            # the ring will be overwritten, messages which reference their buffer need a copy
+            ins = self._decode(memoryview(bytearray(data)) if self.keep_frames or self.raw else data)
+            if not self.shm.valid(pos):
+                self.shm.dropped += 1
+                return
+            size = len(data)
+
+        decoded = perf_counter_ns()
+        stats.messages += 1
+        stats.bytes += size + 4
+        stats.decode_ns += decoded - start
+
+        if self.raw:
+            self.callback(ins, self.headers)
+        else:
+            args = self.args
+            args[self.arg_name_msg] = ins
+            self.callback(**args)
+        end = perf_counter_ns()
+        stats.callback_ns += end - decoded
+
+        tracer = trace.tracer
+        if tracer is not None:
+            tracer.event("frame", self.topic, start, start, size + 4)
+            tracer.event("decode", self.topic, start, decoded, size + 4)
+            tracer.event("callback", self.topic, decoded, end)
+
+    @property
+    def dropped(self) -> int:
+        """messages overwritten in the shared memory ring before they were read"""
+        return self.shm.dropped if self.shm is not None else 0
 
     def connection_lost(self, exc):
         print("The server closed the connection")
+        if self.shm is not None:
+            self.shm.close()
 
@@ -0,0 +1,137 @@
+import json
+import os
+from contextlib import contextmanager
+from threading import get_ident
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# the active tracer of this process, the hot paths only check for None while tracing is disabled
+tracer: Optional["Tracer"] = None
+
+# events of the publish and receive paths, spans have a duration, the others start == end
+EVENTS = (
+    "encode",   # serializing a published message, once for all connections of a node
+    "write",    # passing a frame to the transport of one subscriber, or queueing it while the transport is paused
+    "flush",    # writing the coalesced frames of one subscriber
+    "receive",  # bytes read from the socket of a subscription, size is the number of bytes
+    "frame",    # a complete message frame was received
+    "decode",   # deserializing a received message
+    "callback", # calling the subscriber's callback, only queues the message if it runs in an executor
+    "queue",    # time a message waited for the callback in an executor
+    "run",      # callback in an executor, including the wait for a free worker of the pool
+    "tick",     # message factory and publishing of schedule_publish
+)
+
+
+class Tracer:
+    """Receives the events of the publish and receive paths.
+
+    The events are called in the thread of the event loop, times are from perf_counter_ns.
+    """
+
+    def event(self, name: str, topic: str, start: int, end: int, size: int = 0) -> None:
+        raise NotImplementedError()
+
+
+def enable(t: Tracer) -> None:
+    global tracer
+    tracer = t
+
+
+def disable() -> None:
+    global tracer
+    tracer = None
+
+
+@contextmanager
+def tracing(t: Tracer) -> Iterator[Tracer]:
+    """enable the tracer within a with block"""
+    enable(t)
+    try:
+        yield t
+    finally:
+        disable()
+
+
+class CallbackTracer(Tracer):
+    """Passes every event to a function"""
+
+    def __init__(self, callback: Callable[[str, str, int, int, int], None]) -> None:
+        self.callback = callback
+
+    def event(self, name: str, topic: str, start: int, end: int, size: int = 0) -> None:
+        self.callback(name, topic, start, end, size)
+
+
+class Histogram(Tracer):
+    """Durations of the events by name and topic in power of two buckets of nanoseconds"""
+    buckets: Dict[Tuple[str, str], List[int]]
+    totals: Dict[Tuple[str, str], int]
+
+    def __init__(self) -> None:
+        self.buckets = {}
+        self.totals = {}
+
+    def event(self, name: str, topic: str, start: int, end: int, size: int = 0) -> None:
+        key = (name, topic)
+        buckets = self.buckets.get(key)
+        if buckets is None:
+            buckets = self.buckets[key] = [0] * 64
+            self.totals[key] = 0
+        buckets[(end - start).bit_length()] += 1
+        self.totals[key] += end - start
+
+    def percentile(self, name: str, topic: str, p: float) -> int:
+        """upper bound of the bucket which contains the percentile p (0 to 1) of the durations"""
+        buckets = self.buckets[(name, topic)]
+        rank = p * sum(buckets)
+        seen = 0
+        for i, n in enumerate(buckets):
+            seen += n
+            if n and seen >= rank:
+                return (1 << i) - 1
+        return 0
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """count, mean and percentiles of the durations in µs by topic and event"""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        for (name, topic), buckets in self.buckets.items():
+            count = sum(buckets)
+            result.setdefault(topic, {})[name] = {
+                "count": count,
+                "mean_us": self.totals[(name, topic)] / count / 1000,
+                "p50_us": self.percentile(name, topic, 0.5) / 1000,
+                "p99_us": self.percentile(name, topic, 0.99) / 1000,
+            }
+        return result
+
+
+class ChromeTrace(Tracer):
+    """Collects the events in the Chrome trace event format, which can be opened in chrome://tracing or Perfetto.
+
+    Only the first max_events are kept so a forgotten tracer can't use up the memory.
+    """
+    events: List[Dict[str, Any]]
+
+    def __init__(self, max_events: int = 1_000_000) -> None:
+        self.max_events = max_events
+        self.events = []
+        self.pid = os.getpid()
+
+    def event(self, name: str, topic: str, start: int, end: int, size: int = 0) -> None:
+        if len(self.events) >= self.max_events:
+            return
+
+        e: Dict[str, Any] = {"name": name, "cat": topic, "ts": start / 1000, "pid": self.pid, "tid": get_ident()}
+        if end > start:
+            e["ph"] = "X"
+            e["dur"] = (end - start) / 1000
+        else:
+            e["ph"] = "i"
+            e["s"] = "t"
+        if size:
+            e["args"] = {"size": size}
+        self.events.append(e)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ns"}, f)
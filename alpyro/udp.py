@@ -0,0 +1,162 @@
+from asyncio import DatagramProtocol
+from collections import deque
+from struct import Struct
+from typing import Callable, Deque, List, Optional
+from alpyro.stats import Counters, connection_id
+from alpyro.tcp import TCPROSClient
+
+# connection id, opcode, message id and block number, which is the number of blocks in the first datagram of a message
+_HEADER = Struct("<IBBH")
+_UINT32 = Struct("<I")
+
+DATA0 = 0
+DATAN = 1
+PING = 2
+ERR = 3
+
+# fits into an ethernet frame with the IP and UDP headers
+MAX_DATAGRAM_SIZE = 1472
+
+# datagrams which arrive before the connection id is known, e.g. the message of a latched topic
+_EARLY_DATAGRAMS = 64
+
+
+class UDPROSServer(DatagramProtocol):
+    """UDPROS connection to one subscriber, messages are split into datagrams of at most max_datagram_size.
+
+    Nothing is retransmitted, messages are dropped while the socket buffer is full.
+    """
+    topic: str
+    callerid: str
+    send_data: bool = False
+    paused: bool = False
+    dropped: int = 0
+    latch: bool = False
+    msg_id: int = 0
+
+    # the statistics of the node expect the fields of a TCPROSServer
+    shm = None
+    queue: Deque[bytes]
+    pending: List[bytes]
+    stats: Counters
+    id: int
+
+    def __init__(self, topic: str, callerid: str, max_datagram_size: int, disconnected: Callable[["UDPROSServer"], None]):
+        self.topic = topic
+        self.callerid = callerid
+        self.max_datagram_size = max_datagram_size
+        self.disconnected = disconnected
+        self.queue = deque()
+        self.pending = []
+        self.stats = Counters()
+        self.id = connection_id()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.send_data = True
+
+    def connection_lost(self, exc):
+        if self.send_data:
+            self.disconnected(self)
+        self.send_data = False
+
+    def error_received(self, exc):
+        # the subscriber is gone if its port is closed
+        print(f"UDPROS connection to {self.callerid} for {self.topic} failed: {exc!r}")
+        self.transport.close()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+
+    def publish_frame(self, frame: bytes):
+        """send an encoded message including its length prefix"""
+        if not self.send_data:
+            return
+        if self.paused:
+            self.dropped += 1
+            return
+
+        self.stats.messages += 1
+        self.stats.bytes += len(frame)
+
+        self.msg_id = (self.msg_id + 1) & 0xFF
+        payload = self.max_datagram_size - _HEADER.size
+        blocks = max(1, -(-len(frame) // payload))
+        view = memoryview(frame)
+
+        self.transport.sendto(_HEADER.pack(self.id, DATA0, self.msg_id, blocks) + view[:payload])
+        for block in range(1, blocks):
+            data = view[block * payload : (block + 1) * payload]
+            self.transport.sendto(_HEADER.pack(self.id, DATAN, self.msg_id, block) + data)
+
+
+class UDPROSClient(TCPROSClient, DatagramProtocol):
+    """Subscription over UDPROS, messages are only passed on if all their datagrams arrived in order"""
+    conn_id: Optional[int] = None
+    msg_id: int = 0
+    blocks: int = 0
+    parts: List[bytes]
+    early: List[bytes]
+    # messages which were incomplete
+    dropped: int = 0  # type: ignore
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parts = []
+        self.early = []
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def accept(self, conn_id: int, header: bytes) -> None:
+        """the publisher accepted the connection with its connection header"""
+        self._frame_finished(memoryview(header))
+        self.conn_id = conn_id
+
+        early, self.early = self.early, []
+        for data in early:
+            self.datagram_received(data, None)
+
+    def datagram_received(self, data, addr):
+        if len(data) < _HEADER.size:
+            return
+        if self.conn_id is None:
+            if len(self.early) < _EARLY_DATAGRAMS:
+                self.early.append(data)
+            return
+
+        conn_id, op, msg_id, block = _HEADER.unpack_from(data)
+        if conn_id != self.conn_id:
+            return
+
+        if op == DATA0:
+            if self.parts:
+                self.dropped += 1
+            self.msg_id = msg_id
+            self.blocks = block
+            self.parts = [data[_HEADER.size :]]
+        elif op == DATAN:
+            if not self.parts or msg_id != self.msg_id or block != len(self.parts):
+                # a datagram is missing or out of order, the message can't be completed
+                if self.parts:
+                    self.dropped += 1
+                self.parts = []
+                return
+            self.parts.append(data[_HEADER.size :])
+        else:
+            return
+
+        if len(self.parts) < self.blocks:
+            return
+
+        frame = self.parts[0] if len(self.parts) == 1 else b"".join(self.parts)
+        self.parts = []
+        if len(frame) >= 4:
+            l, = _UINT32.unpack_from(frame)
+            self._msg_finished(memoryview(frame)[4 : 4 + l])
+
+    def error_received(self, exc):
+        print(f"UDPROS subscription of {self.topic} failed: {exc!r}")
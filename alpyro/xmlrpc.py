@@ -1,98 +1,209 @@
 from asyncio.events import AbstractEventLoop
+from base64 import b64decode
+from datetime import datetime
 import inspect
-from typing import Any, Coroutine, List, Tuple, Protocol, Union
-from xml.etree.ElementTree import Element, XML
-from aiohttp import web
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from xml.etree.ElementTree import Element
+from xml.sax.saxutils import escape
+from xmlrpc.client import APPLICATION_ERROR, MAXINT, METHOD_NOT_FOUND, MININT, PARSE_ERROR, Fault, Marshaller, dumps
+from aiohttp import ClientSession, TCPConnector, web
 import xml.etree.ElementTree as ET
 import socket
+from urllib.parse import urlsplit
+from weakref import WeakValueDictionary
 
 XMLRPCValue = Any #TODO FIXME
 
-def parse_args(params: List[Element]):
-    args: List[Any] = []
-    for p in params:
-        if p.tag == "int" or p.tag == "i4":
-            assert p.text
-            args.append(int(p.text))
-        elif p.tag == "string":
-            args.append(p.text)
-        elif p.tag == "array":
-            data = p.find("data")
-            assert not data is None
-            args.append(parse_args([e[0] for e in data.findall("value")]))
-        # TODO implement the other xmlrpc value types
-    return args
-
-
-def to_xml(value: Any) -> Element:
-    v = ET.Element("value")
-
-    if isinstance(value, int):
-        i = ET.SubElement(v, "int")
-        i.text = str(value)
-    elif isinstance(value, str):
-        i = ET.SubElement(v, "string")
-        i.text = value
-    elif isinstance(value, list) or isinstance(value, tuple):
-        arr = ET.SubElement(v, "array")
-        data = ET.SubElement(arr, "data")
-        for e in value:
-            data.append(to_xml(e))
-    # TODO implement the other xmlrpc value types
-
-    return v
+_SCALARS: Dict[str, Callable[[str], Any]] = {
+    "int": int,
+    "i4": int,
+    "i8": int,
+    "string": str,
+    "double": float,
+    "boolean": lambda text: text.strip() == "1",
+    "base64": b64decode,
+    "dateTime.iso8601": lambda text: datetime.strptime(text.strip(), "%Y%m%dT%H:%M:%S"),
+    "nil": lambda text: None,
+}
+
+
+def load_value(value: Element) -> Any:
+    if len(value) == 0:
+        # a value without a type is a string
+        return value.text or ""
+
+    typed = value[0]
+    tag = typed.tag
+    if tag == "array":
+        return [load_value(v) for v in typed[0]] if len(typed) else []
+    if tag == "struct":
+        return {member[0].text or "": load_value(member[1]) for member in typed}
+    return _SCALARS[tag](typed.text or "")
+
+
+def load(data: bytes) -> Tuple[List[Any], Optional[str]]:
+    """params and method name of a call or response, raises Fault for fault responses
+
+    The tree of the C parser is walked directly, which is faster than the expat callbacks of xmlrpc.client.loads.
+    """
+    root = ET.fromstring(data)
+
+    fault = root.find("fault")
+    if fault is not None:
+        raise Fault(**load_value(fault[0]))
+
+    params = root.find("params")
+    args = [load_value(param[0]) for param in params] if params is not None else []
+    return args, root.findtext("methodName")
+
+
+class _Marshaller(Marshaller):
+    """Marshaller which sends ints beyond 32 bit as i8 instead of raising, e.g. for the byte counters of getBusStats"""
+    dispatch = dict(Marshaller.dispatch)
+
+    def dump_long(self, value, write):
+        tag = "int" if MININT <= value <= MAXINT else "i8"
+        write(f"<value><{tag}>{int(value)}</{tag}></value>\n")
+
+    dispatch[int] = dump_long
+
+
+def dump_call(method: str, args: Tuple[Any, ...]) -> bytes:
+    body = _Marshaller(allow_none=True).dumps(args)
+    return f"<?xml version='1.0'?>\n<methodCall>\n<methodName>{escape(method)}</methodName>\n{body}</methodCall>\n".encode()
+
+
+def dump_response(value: Any) -> bytes:
+    """a response with a single param, or a fault"""
+    if isinstance(value, Fault):
+        return dumps(value, methodresponse=True, allow_none=True).encode()
+    body = _Marshaller(allow_none=True).dumps((value,))
+    return f"<?xml version='1.0'?>\n<methodResponse>\n{body}</methodResponse>\n".encode()
+
+
+# running servers of this process by port
+_SERVERS: "WeakValueDictionary[int, XMLRPCServer]" = WeakValueDictionary()
+
+
+def local_server(uri: str) -> Optional["XMLRPCServer"]:
+    """the server of this process which answers calls to uri, None if it runs somewhere else"""
+    url = urlsplit(uri)
+    server = _SERVERS.get(url.port or 80)
+    if server is None or not server.loop_server.is_serving():
+        return None
+    host = url.hostname or ""
+    if host in (server.addr[0], "localhost", "0.0.0.0") or host.startswith("127."):
+        return server
+    return None
 
 
 class XMLRPCServer:
+    """Calls its methods for XML-RPC requests.
+
+    All XML-RPC types are supported, base64 values become bytes and dateTime.iso8601 values datetime objects.
+    Errors are answered with fault responses.
+    """
     loop: AbstractEventLoop
     addr: Tuple[str, int]
+    # bound methods by name and whether they are coroutine functions
+    methods: Dict[str, Tuple[Callable[..., Any], bool]]
 
     def __init__(self, loop: AbstractEventLoop) -> None:
         self.loop = loop
+        self.methods = {}
 
     def create_server(self):
         self.loop.run_until_complete(self.start_server())
 
-    async def start_server(self):
+    async def start_server(self, port: int = 0):
         self.server = web.Server(self.handler)
 
         host_name = socket.gethostname()
 
-        self.loop_server = await self.loop.create_server(self.server, "0.0.0.0", 0)
+        self.loop_server = await self.loop.create_server(self.server, "0.0.0.0", port)
         _, port = self.loop_server.sockets[0].getsockname()
 
         self.addr = (host_name, port)
+        _SERVERS[port] = self
         print("Started the XMLRPC endpoint at address:", self.addr)
 
-    async def handler(self, request):
-        root = ET.fromstring(await request.text())
-
-        method = root.find("methodName").text
-        params = [e.find("value")[0] for e in root.find("params").findall("param")]
+    def _method(self, name: str) -> Optional[Tuple[Callable[..., Any], bool]]:
+        method = self.methods.get(name)
+        if method is None and not name.startswith("_"):
+            fun = getattr(self, name, None)
+            if callable(fun):
+                method = self.methods[name] = (fun, inspect.iscoroutinefunction(fun))
+        return method
 
-        args = parse_args(params)
-        fun = getattr(self, method)
+    async def handler(self, request):
+        try:
+            args, name = load(await request.read())
+        except Exception as e:
+            return self._response(Fault(PARSE_ERROR, f"invalid request: {e}"))
 
-        if inspect.iscoroutinefunction(fun):
-            ret = await fun(*args)
-        else:
-            ret = fun(*args)
+        method = self._method(name or "")
+        if method is None:
+            return self._response(Fault(METHOD_NOT_FOUND, f"method {name} is not supported"))
 
-        response = ET.Element("methodResponse")
-        responseParams = ET.SubElement(response, "params")
+        fun, is_coroutine = method
         try:
-            for p in ret:
-                param = ET.SubElement(responseParams, "param")
-                param.append(to_xml(p))
-        except TypeError:
-            param = ET.SubElement(responseParams, "param")
-            param.append(to_xml(ret))
+            ret = await fun(*args) if is_coroutine else fun(*args)
+        except Exception as e:
+            print(f"XMLRPC method {name} failed: {e!r}")
+            return self._response(Fault(APPLICATION_ERROR, f"{type(e).__name__}: {e}"))
 
-        return web.Response(body=ET.tostring(response))
+        return self._response(ret)
+
+    def _response(self, value: Any) -> web.Response:
+        return web.Response(body=dump_response(value), content_type="text/xml")
 
     @property
     def uri(self):
         addr, port = self.addr
         return f"http://{addr}:{port}"
 
-    # TODO add default function which can return a proper rpc error instead of raising an exception
+
+class XMLRPCProxy:
+    def __init__(self, client: "XMLRPCClient", uri: str) -> None:
+        self.client = client
+        self.uri = uri
+
+    def __getattr__(self, method: str) -> Callable[..., Awaitable[Any]]:
+        async def call(*args: Any) -> Any:
+            return await self.client.call(self.uri, method, *args)
+        return call
+
+
+class XMLRPCClient:
+    """asyncio XML-RPC client, the HTTP connections to each URI are kept alive and reused"""
+    session: Optional[ClientSession]
+
+    def __init__(self, limit_per_host: int = 4) -> None:
+        self.limit_per_host = limit_per_host
+        self.session = None
+        self.proxies: Dict[str, XMLRPCProxy] = {}
+
+    async def call(self, uri: str, method: str, *args: Any) -> Any:
+        if self.session is None:
+            self.session = ClientSession(connector=TCPConnector(limit=0, limit_per_host=self.limit_per_host))
+
+        async with self.session.post(uri, data=dump_call(method, args), headers={"Content-Type": "text/xml"}) as response:
+            body = await response.read()
+
+        # raises xmlrpc.client.Fault for fault responses, multiple params are returned as tuple like ServerProxy does
+        ret, _ = load(body)
+        if len(ret) != 1:
+            return ret
+        # the (code, status, value) responses of the ROS APIs are a single array
+        return tuple(ret[0]) if isinstance(ret[0], list) else ret[0]
+
+    def proxy(self, uri: str) -> XMLRPCProxy:
+        proxy = self.proxies.get(uri)
+        if proxy is None:
+            proxy = self.proxies[uri] = XMLRPCProxy(self, uri)
+        return proxy
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
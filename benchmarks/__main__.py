@@ -0,0 +1,79 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict
+from benchmarks import codec, transport
+
+# metrics where a higher value is better, for all others (latencies, times) lower is better
+_HIGHER_IS_BETTER = ("_per_s",)
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any], threshold: float) -> bool:
+    """print the change of every metric, returns False if one got worse by more than threshold"""
+    ok = True
+    for name, metrics in new["results"].items():
+        for metric, val in metrics.items():
+            before = old["results"].get(name, {}).get(metric)
+            if not before or metric == "bytes":
+                continue
+
+            change = val / before - 1
+            if not metric.endswith(_HIGHER_IS_BETTER):
+                change = -change
+            worse = change < -threshold
+            ok = ok and not worse
+            print(f"{name:30} {metric:24} {before:14.2f} -> {val:14.2f} {change:+7.1%}{'  !!' if worse else ''}")
+    return ok
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="alpyro benchmarks")
+    parser.add_argument("--quick", action="store_true", help="shorter runs for a rough estimate")
+    parser.add_argument("--only", choices=("codec", "transport"), help="run only one group")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change counted as regression")
+    args = parser.parse_args()
+
+    results: Dict[str, Any] = {}
+    if args.only in (None, "codec"):
+        results.update(codec.run(args.quick))
+    if args.only in (None, "transport"):
+        results.update(transport.run(args.quick))
+
+    report = {
+        "commit": _commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            return 0 if compare(json.load(f), report, args.threshold) else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
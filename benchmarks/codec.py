@@ -0,0 +1,94 @@
+import timeit
+from typing import Any, Callable, Dict, List, Tuple
+from alpyro_msgs import RosMessage, Time
+from alpyro_msgs.sensor_msgs.image import Image
+from alpyro_msgs.std_msgs.float32multiarray import Float32MultiArray
+from alpyro_msgs.std_msgs.header import Header
+from alpyro_msgs.std_msgs.multiarraylayout import MultiArrayLayout
+from alpyro_msgs.std_msgs.string import String
+from alpyro.tcp import TCPROSConverter
+
+
+def string() -> String:
+    s = String()
+    s.data = "Hello there!"
+    return s
+
+
+def header() -> Header:
+    h = Header()
+    h.seq = 42
+    h.stamp = Time(1600000000, 123456789)
+    h.frame_id = "base_link"
+    return h
+
+
+def floats(n: int) -> Callable[[], Float32MultiArray]:
+    def factory() -> Float32MultiArray:
+        a = Float32MultiArray()
+        a.layout = MultiArrayLayout()
+        a.layout.dim = []
+        a.layout.data_offset = 0
+        a.data = [float(i) for i in range(n)]
+        return a
+    return factory
+
+
+def image() -> Image:
+    img = Image()
+    img.header = header()
+    img.height = 480
+    img.width = 640
+    img.encoding = "rgb8"
+    img.is_bigendian = 0
+    img.step = 640 * 3
+    img.data = bytes(640 * 480 * 3)
+    return img
+
+
+SHAPES: List[Tuple[str, Callable[[], RosMessage]]] = [
+    ("string", string),
+    ("header", header),
+    ("float32[10]", floats(10)),
+    ("float32[1000]", floats(1000)),
+    ("float32[100000]", floats(100000)),
+    ("image_640x480", image),
+]
+
+
+def _measure(f: Callable[[], Any], min_time: float) -> float:
+    """seconds per call"""
+    timer = timeit.Timer(f)
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    return elapsed / number
+
+
+def run(quick: bool = False) -> Dict[str, Dict[str, float]]:
+    min_time = 0.05 if quick else 0.5
+    results = {}
+
+    for name, factory in SHAPES:
+        msg = factory()
+        typ = type(msg)
+        size = len(TCPROSConverter().encode(msg))
+
+        for mode, converter in (("", TCPROSConverter()), ("_arrays", TCPROSConverter(arrays=True))):
+            if mode and not name.startswith("float32"):
+                continue
+
+            data = bytes(converter.encode(msg))
+            encode = _measure(lambda: converter.encode_frame(msg), min_time)
+            decode = _measure(lambda: converter.decode(typ(), data), min_time)
+
+            results[f"codec/{name}{mode}"] = {
+                "bytes": size,
+                "encode_per_s": 1 / encode,
+                "decode_per_s": 1 / decode,
+                "encode_mb_per_s": size / encode / 1e6,
+                "decode_mb_per_s": size / decode / 1e6,
+            }
+
+    return results
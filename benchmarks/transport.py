@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import io
+import time
+from typing import Any, Callable, Dict, List
+from alpyro_msgs import Time
+from alpyro_msgs.std_msgs.header import Header
+from alpyro.master import Master
+from alpyro.node import Node
+
+TOPIC = "/bench"
+
+
+def _stamp(h: Header) -> None:
+    h.stamp = Time(*divmod(time.perf_counter_ns(), 1_000_000_000))
+
+
+def _age(h: Header) -> int:
+    return time.perf_counter_ns() - (h.stamp.secs * 1_000_000_000 + h.stamp.nsecs)
+
+
+def _percentile(values: List[int], p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] / 1000
+
+
+async def _connected(pub: Node, count: int, intra: bool) -> None:
+    subs = pub.local_subs if intra else pub.pubs
+    while len(subs[TOPIC]) < count:
+        await asyncio.sleep(0.01)
+
+
+async def _wait(condition: Callable[[], bool]) -> None:
+    while not condition():
+        await asyncio.sleep(0)
+
+
+async def _publish(pub: Node, count: int, window: int, delivered: Callable[[], int]) -> float:
+    """publish count messages with at most window of them in flight, returns the seconds spent in publish"""
+    h = Header()
+    h.frame_id = "bench"
+    spent = 0.0
+    for seq in range(count):
+        if seq - delivered() >= window:
+            await _wait(lambda: seq - delivered() < window)
+        h.seq = seq
+        _stamp(h)
+        start = time.perf_counter()
+        pub.publish(TOPIC, h)
+        spent += time.perf_counter() - start
+    await _wait(lambda: delivered() >= count)
+    return spent
+
+
+async def loopback(master: str, count: int, intra: bool) -> Dict[str, float]:
+    name = "intra" if intra else "tcpros"
+    async with Node(f"/bench_pub_{name}", master) as pub, Node(f"/bench_sub_{name}", master) as sub:
+        await pub.announce_async(TOPIC, Header)
+        latencies: List[int] = []
+
+        def callback(msg: Header):
+            latencies.append(_age(msg))
+
+        await sub.subscribe_async(TOPIC, callback, intra_process=intra)
+        await _connected(pub, 1, intra)
+
+        # one message in flight for the latency of an idle connection
+        await _publish(pub, count // 10, 1, lambda: len(latencies))
+        idle = latencies[:]
+        latencies.clear()
+
+        start = time.perf_counter()
+        await _publish(pub, count, 100, lambda: len(latencies))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "msgs_per_s": count / elapsed,
+        "latency_p50_us": _percentile(idle, 0.5),
+        "latency_p90_us": _percentile(idle, 0.9),
+        "latency_p99_us": _percentile(idle, 0.99),
+        "loaded_latency_p50_us": _percentile(latencies, 0.5),
+        "loaded_latency_p99_us": _percentile(latencies, 0.99),
+    }
+
+
+def _counter(received: List[int], i: int) -> Callable[[Header], None]:
+    def callback(msg: Header):
+        received[i] += 1
+    return callback
+
+
+async def fan_out(master: str, count: int, subscribers: int) -> Dict[str, float]:
+    async with Node(f"/bench_fan_out_{subscribers}", master) as pub:
+        await pub.announce_async(TOPIC, Header)
+        received = [0] * subscribers
+        nodes = []
+
+        for i in range(subscribers):
+            node = Node(f"/bench_fan_out_{subscribers}_{i}", master)
+            await node.open_async()
+            nodes.append(node)
+
+            await node.subscribe_async(TOPIC, _counter(received, i), intra_process=False)
+
+        await _connected(pub, subscribers, False)
+        start = time.perf_counter()
+        spent = await _publish(pub, count, 100, lambda: min(received))
+        elapsed = time.perf_counter() - start
+
+        for node in nodes:
+            await node.close_async()
+
+    return {
+        "msgs_per_s": count / elapsed,
+        "deliveries_per_s": count * subscribers / elapsed,
+        "publish_us": spent / count * 1e6,
+    }
+
+
+def run(quick: bool = False) -> Dict[str, Dict[str, Any]]:
+    count = 2000 if quick else 20000
+    results = {}
+
+    async def main():
+        async with Master() as master:
+            for intra in (False, True):
+                results[f"loopback/{'intra' if intra else 'tcpros'}"] = await loopback(master.uri, count, intra)
+            for subscribers in (1, 4, 16):
+                results[f"fan_out/{subscribers}"] = await fan_out(master.uri, count // 4, subscribers)
+
+    # the nodes print their connection changes
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    with contextlib.redirect_stdout(io.StringIO()):
+        loop.run_until_complete(main())
+    loop.close()
+    return results
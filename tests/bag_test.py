@@ -0,0 +1,111 @@
+from alpyro_msgs.std_msgs.string import String
+from alpyro_msgs.geometry_msgs.point import Point
+from alpyro.bag import BagReader, BagWriter, Player, Recorder, message_type
+from alpyro.node import Node
+from tests.tcp_test import FakeTransport, converter, frame
+
+START = 1_700_000_000_000_000_000
+
+
+def header(typ):
+    return {
+        "type": typ.__msg_typ__,
+        "md5sum": typ.__md5_sum__,
+        "message_definition": typ.get_msg_def(),
+        "callerid": "/pub",
+    }
+
+
+def write_bag(path, compression="none", count=50):
+    with BagWriter(path, compression, chunk_size=256) as writer:
+        strings = writer.add_connection("/chatter", header(String))
+        points = writer.add_connection("/point", header(Point))
+        for i in range(count):
+            s = String()
+            s.data = f"hello {i}"
+            writer.write(strings, converter.encode(s), START + i * 10_000_000)
+
+            p = Point()
+            p.x, p.y, p.z = float(i), 0.0, 0.0
+            writer.write(points, converter.encode(p), START + i * 10_000_000 + 5)
+        return len(writer.chunk_infos)
+
+
+def decode(typ, data):
+    msg = typ()
+    converter.decode(msg, data)
+    return msg
+
+
+def test_round_trip(tmp_path):
+    for compression in ("none", "bz2"):
+        path = str(tmp_path / f"{compression}.bag")
+        write_bag(path, compression)
+
+        with BagReader(path) as reader:
+            assert reader.topics() == {"/chatter": "std_msgs/String", "/point": "geometry_msgs/Point"}
+            assert len(reader.chunk_infos) > 1
+
+            msgs = list(reader.messages())
+            assert [m.connection.topic for m in msgs[:4]] == ["/chatter", "/point"] * 2
+            assert [decode(String, m.data).data for m in msgs[::2]] == [f"hello {i}" for i in range(50)]
+            assert msgs[3].time.secs == START // 10**9 and msgs[3].time.nsecs == 10_000_005
+            del msgs
+
+
+def test_seek(tmp_path):
+    path = str(tmp_path / "seek.bag")
+    chunks = write_bag(path)
+
+    with BagReader(path) as reader:
+        read = []
+        chunk = reader._chunk
+        reader._chunk = lambda index: read.append(index) or chunk(index)
+
+        points = [decode(Point, m.data).x for m in reader.messages(["/point"], START / 1e9 + 0.2, START / 1e9 + 0.3)]
+        assert points == [20.0, 21.0, 22.0, 23.0, 24.0, 25.0, 26.0, 27.0, 28.0, 29.0]
+        # only the chunks of the time range are read
+        assert 0 < len(set(read)) < chunks / 2
+
+
+def test_message_type():
+    assert message_type(header(String)) is String
+
+    unknown = {"type": "foo/Bar", "md5sum": "1234", "message_definition": "int32 x\n"}
+    typ = message_type(unknown)
+    assert typ.__msg_typ__ == "foo/Bar" and typ.get_msg_def() == "int32 x\n"
+    assert message_type(unknown) is typ
+
+
+def test_record_and_play(tmp_path, monkeypatch):
+    node = Node("/player")
+
+    async def rpc(uri, method, *args):
+        return 1, "", []
+
+    monkeypatch.setattr(node, "_rpc", rpc)
+    node.addr = ("localhost", 1)
+    path = str(tmp_path / "record.bag")
+
+    recorder = Recorder(node, path, ["/chatter"])
+    recorder.start()
+    msgs = []
+    for i in range(5):
+        s = String()
+        s.data = f"message {i}"
+        msgs.append(s)
+        recorder._record("/chatter", memoryview(converter.encode(s)), {**header(String), "topic": "/chatter"})
+    recorder.close()
+
+    player = Player(node, path, rate=0)
+    node.loop.run_until_complete(node.announce_async("/chatter", String))
+    server = node._tcpros_server()
+    server.connection_made(FakeTransport())
+    server.data_received(converter.encode_header(String, "/sub", "/chatter"))
+    server.transport.data.clear()
+
+    player.play()
+    player.close()
+    node.scheduler.close()
+
+    assert server.transport.data == b"".join(frame(m) for m in msgs)
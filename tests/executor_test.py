@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from alpyro.executor import AsyncExecutor, PoolExecutor
+
+
+def run(loop, executor, count):
+    async def main():
+        for i in range(count):
+            executor(msg=i)
+        while executor.running is not None:
+            await asyncio.sleep(0.01)
+
+    loop.run_until_complete(main())
+
+
+def test_thread_executor_keeps_order():
+    loop = asyncio.new_event_loop()
+    received = []
+    threads = set()
+
+    def callback(msg):
+        threads.add(threading.get_ident())
+        received.append(msg)
+
+    with ThreadPoolExecutor(4) as pool:
+        run(loop, PoolExecutor(callback, loop, pool, queue_size=0), 50)
+
+    assert received == list(range(50))
+    assert threading.get_ident() not in threads
+    loop.close()
+
+
+def test_queue_drops_oldest():
+    loop = asyncio.new_event_loop()
+    received = []
+
+    async def callback(msg):
+        await asyncio.sleep(0.01)
+        received.append(msg)
+
+    executor = AsyncExecutor(callback, loop, queue_size=3)
+    run(loop, executor, 10)
+    assert received == [0, 7, 8, 9]
+    assert executor.dropped == 6
+
+    latest = AsyncExecutor(callback, loop, latest_only=True)
+    received.clear()
+    run(loop, latest, 10)
+    assert received == [0, 9]
+    loop.close()
+
+
+def test_exception_handler():
+    loop = asyncio.new_event_loop()
+    errors = []
+    loop.set_exception_handler(lambda loop, context: errors.append(context["exception"]))
+
+    async def callback(msg):
+        raise ValueError(msg)
+
+    run(loop, AsyncExecutor(callback, loop), 2)
+
+    assert [e.args for e in errors] == [(0,), (1,)]
+    loop.close()
@@ -0,0 +1,93 @@
+import asyncio
+from alpyro_msgs.std_msgs.string import String
+from alpyro.master import Master
+from alpyro.node import Node
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+async def wait_for(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    assert condition()
+
+
+def test_publisher_update():
+    async def main():
+        received = []
+
+        def callback(msg: String):
+            received.append(msg.data)
+
+        async with Master() as master:
+            async with Node("/listener", master.uri) as sub:
+                # subscribe before the publisher exists, it is connected by publisherUpdate
+                await sub.subscribe_async("/chatter", callback, intra_process=False)
+
+                async with Node("/talker", master.uri) as pub:
+                    await pub.announce_async("/chatter", String)
+                    await wait_for(lambda: pub.pubs["/chatter"])
+
+                    s = String()
+                    s.data = "hello"
+                    pub.publish("/chatter", s)
+                    await wait_for(lambda: received)
+                    stats = sub.stats()["subscriptions"]["/chatter"]
+                    assert (stats["messages"], stats["bytes"]) == (1, 13)
+                    assert stats["connections"][0]["destination"] == pub.uri
+
+                    code, _, (pubs, subs, _) = await master.getSystemState("/test")
+                    assert pubs == [["/chatter", ["/talker"]]]
+                    assert subs == [["/chatter", ["/listener"]]]
+                    assert (await master.lookupNode("/test", "/talker"))[2] == pub.uri
+
+                await wait_for(lambda: not master.publishers["/chatter"])
+        assert received == ["hello"]
+
+    run(main())
+
+
+def test_params():
+    async def main():
+        async with Master() as master:
+            await master.setParam("/ns/node", "rate", 10)
+            await master.setParam("/ns/node", "~private", {"a": 1.5, "b": True})
+            await master.setParam("/ns/node", "/global", "value")
+
+            assert await master.getParam("/", "/ns/rate") == (1, "Parameter [/ns/rate]", 10)
+            assert (await master.getParam("/", "/ns/node/private/a"))[2] == 1.5
+            assert (await master.getParam("/", "/missing"))[0] == -1
+            assert sorted((await master.getParamNames("/"))[2]) == [
+                "/global", "/ns/node/private/a", "/ns/node/private/b", "/ns/rate"
+            ]
+
+            assert (await master.searchParam("/ns/node", "rate"))[2] == "/ns/rate"
+            assert (await master.searchParam("/ns/deep/node", "global"))[2] == "/global"
+            assert (await master.searchParam("/ns/node", "missing"))[0] == -1
+
+            assert (await master.deleteParam("/", "/ns/node/private"))[0] == 1
+            assert not (await master.hasParam("/", "/ns/node/private/a"))[2]
+
+    run(main())
+
+
+def test_param_update():
+    async def main():
+        async with Master() as master, Node("/node", master.uri) as node:
+            updates = []
+            await node.param.set_async("/config/gain", 1)
+            assert await node.param.subscribe_async("/config", updates.append) == {"gain": 1}
+
+            await node.param.set_async("/config/gain", 2)
+            await wait_for(lambda: updates)
+            assert updates == [{"gain": 2}]
+
+            await node.param.delete_async("/config")
+            await wait_for(lambda: len(updates) == 2)
+            assert updates[1] == {}
+
+    run(main())
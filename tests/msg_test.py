@@ -5,8 +5,18 @@ from alpyro_msgs.sensor_msgs.temperature import  Temperature
 from alpyro_msgs.sensor_msgs.joyfeedback import JoyFeedback
 from alpyro_msgs.shape_msgs.meshtriangle import MeshTriangle
 from alpyro_msgs.sensor_msgs.image import Image
-from pytest import approx, raises, fixture
+from alpyro_msgs.sensor_msgs.pointcloud2 import PointCloud2
+from alpyro_msgs.sensor_msgs.pointfield import PointField
+from alpyro_msgs import Time
+from alpyro_msgs.geometry_msgs.pose import Pose
+from alpyro_msgs.geometry_msgs.posearray import PoseArray
+from alpyro_msgs.geometry_msgs.point import Point
+from alpyro_msgs.geometry_msgs.quaternion import Quaternion
+from pytest import approx, raises, fixture, importorskip
+from alpyro.codec import get_codec
 from alpyro.tcp import TCPROSConverter
+import struct
+from array import array
 
 @fixture
 def tcp_converter():
@@ -85,4 +95,141 @@ def test_bytes(tcp_converter):
 
     assert i.header.seq == i2.header.seq
     assert i.data == i2.data
-    assert i2.data.decode("utf-8") == "foo"
\ No newline at end of file
+    assert i2.data.decode("utf-8") == "foo"
+
+
+def test_wire_format(tcp_converter):
+    t = Temperature()
+    t.header = Header()
+    t.header.seq = 7
+    t.header.stamp = Time(1, 2)
+    t.header.frame_id = "foo"
+    t.temperature = 1.5
+    t.variance = 0.25
+
+    expected = struct.pack("<III", 7, 1, 2) + struct.pack("<I", 3) + b"foo" + struct.pack("<dd", 1.5, 0.25)
+    assert tcp_converter.encode(t) == expected
+
+
+def test_subclass(tcp_converter):
+    class MyString(String):
+        pass
+
+    s = MyString()
+    s.data = "hello"
+    assert tcp_converter.encode(s) == b"\x05\x00\x00\x00hello"
+
+    s2 = MyString()
+    tcp_converter.decode(s2, tcp_converter.encode(s))
+    assert s2.data == "hello"
+
+
+def test_boolean(tcp_converter):
+    p = PointCloud2()
+    p.is_bigendian = True
+    p.is_dense = False
+
+    p2 = PointCloud2()
+    tcp_converter.decode(p2, tcp_converter.encode(p))
+
+    assert p2.is_bigendian is True
+    assert p2.is_dense is False
+
+def test_unicode_string(tcp_converter):
+    s1 = String()
+    s1.data = "Grüße"
+
+    s2 = String()
+    tcp_converter.decode(s2, tcp_converter.encode(s1))
+
+    assert s1.data == s2.data
+
+def test_codec_cached():
+    assert get_codec(String) is get_codec(String)
+
+def test_array_mode():
+    converter = TCPROSConverter(arrays=True)
+
+    v1 = ChannelFloat32()
+    v1.values = [1.5, 2.5, 3.5]
+    t1 = MeshTriangle()
+    t1.vertex_indices = [1, 2, 3]
+
+    v2 = ChannelFloat32()
+    converter.decode(v2, converter.encode(v1))
+    t2 = MeshTriangle()
+    converter.decode(t2, converter.encode(t1))
+
+    assert not isinstance(v2.values, list)
+    assert list(v2.values) == v1.values
+    assert list(t2.vertex_indices) == t1.vertex_indices
+
+def test_encode_buffers(tcp_converter):
+    v1 = ChannelFloat32()
+    v1.values = [1.5, 2.5, 3.5]
+    expected = tcp_converter.encode(v1)
+
+    v1.values = array("f", [1.5, 2.5, 3.5])
+    assert tcp_converter.encode(v1) == expected
+
+    np = importorskip("numpy")
+    v1.values = np.array([1.5, 2.5, 3.5])
+    assert tcp_converter.encode(v1) == expected
+
+    t = MeshTriangle()
+    t.vertex_indices = np.arange(4)
+    with raises(AssertionError):
+        tcp_converter.encode(t)
+
+    # the count is the number of elements, not the length of the first dimension
+    v1.values = [1.5, 2.5, 3.5, 4.5, 5.5, 6.5]
+    expected = tcp_converter.encode(v1)
+    v1.values = np.array(v1.values, np.float32).reshape(3, 2)
+    assert tcp_converter.encode(v1) == expected
+
+def test_lazy(tcp_converter):
+    p = PointCloud2()
+    p.header = Header()
+    p.header.stamp = Time(5, 6)
+    p.header.frame_id = "foo"
+    p.fields = [PointField(), PointField()]
+    p.fields[1].name = "x"
+    p.data = b"abc"
+    p.is_dense = True
+    data = tcp_converter.encode(p)
+
+    lazy = get_codec(PointCloud2).lazy_type()(memoryview(data))
+
+    assert isinstance(lazy, PointCloud2)
+    assert lazy.header.stamp.secs == 5
+    assert lazy.fields[1].name == "x"
+    assert lazy.is_dense is True
+    assert "data" not in lazy.__dict__
+    assert tcp_converter.encode(lazy) == data
+
+
+def test_decode_into():
+    def pose_array(n):
+        a = PoseArray()
+        a.header = Header()
+        a.header.frame_id = f"frame {n}"
+        a.poses = []
+        for i in range(n):
+            p = Pose()
+            p.position = Point()
+            p.position.x = float(i)
+            p.orientation = Quaternion()
+            a.poses.append(p)
+        return a
+
+    codec = get_codec(PoseArray)
+    msg = PoseArray()
+    codec.decode_into(msg, codec.encode(pose_array(3)))
+    header, poses = msg.header, list(msg.poses)
+
+    for n in (5, 2):
+        codec.decode_into(msg, codec.encode(pose_array(n)))
+        assert msg.header is header
+        assert msg.header.frame_id == f"frame {n}"
+        assert [p.position.x for p in msg.poses] == [float(i) for i in range(n)]
+        assert all(a is b for a, b in zip(msg.poses, poses))
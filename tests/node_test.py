@@ -0,0 +1,368 @@
+import asyncio
+from threading import Thread
+from typing import Optional
+from alpyro_msgs.std_msgs.string import String
+from alpyro_msgs.sensor_msgs.channelfloat32 import ChannelFloat32
+from alpyro.master import Master
+from alpyro.node import Node, _LOCAL_NODES
+from alpyro.stats import Counters
+from pytest import fixture, raises
+from tests.tcp_test import FakeTransport, converter, frame
+
+
+@fixture
+def node():
+    return Node("/test")
+
+
+def add_publishers(node, topic, typ, count, **options):
+    node.pubs[topic] = {}
+    node.local_subs[topic] = {}
+    node.topic_typ[topic] = typ
+    node.pub_options[topic] = options
+    node.pub_stats[topic] = Counters()
+    servers = []
+    for i in range(count):
+        server = node._tcpros_server()
+        server.connection_made(FakeTransport())
+        server.data_received(converter.encode_header(typ, f"/sub{i}", topic))
+        server.transport.data.clear()
+        servers.append(server)
+    return servers
+
+
+def test_routing(node):
+    servers = add_publishers(node, "/topic", String, 2)
+    other = add_publishers(node, "/other", String, 1)
+
+    assert node.pubs["/topic"] == {"/sub0": servers[0], "/sub1": servers[1]}
+    assert node.pubs["/other"] == {"/sub0": other[0]}
+
+    servers[0].connection_lost(None)
+    assert node.pubs["/topic"] == {"/sub1": servers[1]}
+
+
+def test_publish_fan_out(node, monkeypatch):
+    servers = add_publishers(node, "/topic", String, 3)
+    s = String()
+    s.data = "foo"
+
+    encoded = []
+    encode_frame = node.converter.encode_frame
+    monkeypatch.setattr(node.converter, "encode_frame", lambda msg: encoded.append(msg) or encode_frame(msg))
+
+    node.publish("/topic", s)
+    node.publish_serialized("/topic", b"\x03\x00\x00\x00bar")
+
+    assert len(encoded) == 1
+    for server in servers:
+        assert server.transport.data == frame(s) + b"\x07\x00\x00\x00\x03\x00\x00\x00bar"
+
+
+def test_stats(node):
+    servers = add_publishers(node, "/topic", String, 2)
+    s = String()
+    s.data = "foo"
+    node.publish("/topic", s)
+    node.publish_serialized("/topic", b"\x03\x00\x00\x00bar")
+    servers[1].pause_writing()
+    node.publish("/topic", s)
+
+    stats = node.stats()["publications"]["/topic"]
+    assert stats["messages"] == 3
+    assert stats["bytes"] == 3 * len(frame(s))
+    assert stats["queue"] == 1
+    assert [(c["destination"], c["messages"], c["queue"]) for c in stats["connections"]] == [("/sub0", 3, 0), ("/sub1", 3, 1)]
+
+    code, _, (pub_stats, sub_stats, _) = node.loop.run_until_complete(node.getBusStats("/caller"))
+    assert pub_stats == [["/topic", 33, [[servers[0].id, 33, 3, True], [servers[1].id, 33, 3, True]]]]
+    assert sub_stats == []
+
+    code, _, info = node.loop.run_until_complete(node.getBusInfo("/caller"))
+    assert info[0][:6] == [servers[0].id, "/sub0", "o", "TCPROS", "/topic", True]
+
+
+def test_publisher_update_concurrent(node):
+    node.subs["/topic"] = {}
+    node.topic_typ["/topic"] = String
+    node.connect_limit = asyncio.Semaphore(4)
+    node.connect_retries = 3
+    attempts = []
+    running = []
+
+    async def fake_subscribe(pub, topic, typ):
+        attempts.append(pub)
+        running.append(pub)
+        assert len(running) <= 4
+        await asyncio.sleep(0.05)
+        running.remove(pub)
+        if pub == "/flaky" and attempts.count(pub) < 2:
+            raise ConnectionError("not ready")
+        node.subs[topic][pub] = pub
+
+    node.__subscribe__ = fake_subscribe
+    pubs = [f"/pub{i}" for i in range(12)] + ["/flaky"]
+
+    async def update():
+        await node.publisherUpdate("/master", "/topic", pubs)
+        # a second update while the first connections are still set up
+        await node.publisherUpdate("/master", "/topic", pubs)
+        while node.connecting:
+            await asyncio.sleep(0.01)
+
+    node.loop.run_until_complete(update())
+
+    assert set(node.subs["/topic"]) == set(pubs)
+    assert sorted(attempts) == sorted(pubs + ["/flaky"])
+
+
+def test_connect_gives_up(node, monkeypatch):
+    node.subs["/topic"] = {}
+    node.topic_typ["/topic"] = String
+    node.connect_retries = 3
+    delays = []
+
+    async def fake_subscribe(pub, topic, typ):
+        raise ConnectionError("not ready")
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+
+    node.__subscribe__ = fake_subscribe
+    monkeypatch.setattr("alpyro.node.sleep", fake_sleep)
+
+    async def update():
+        await node.publisherUpdate("/master", "/topic", ["/pub"])
+        while node.connecting:
+            await asyncio.sleep(0)
+
+    node.loop.run_until_complete(update())
+
+    # no backoff after the last attempt
+    assert delays == [0.1, 0.2]
+    assert node.subs["/topic"] == {}
+
+
+def test_process_executor_checked_first(node):
+    calls = []
+
+    async def fake_rpc(uri, method, *args):
+        calls.append(method)
+        return 1, "", []
+
+    node._rpc = fake_rpc
+
+    def with_node(msg: String, n: Node):
+        pass
+
+    def local(msg: String):
+        pass
+
+    with raises(AssertionError):
+        node.loop.run_until_complete(node.subscribe_async("/topic", with_node, executor="process"))
+    # local functions can't be pickled
+    with raises(Exception):
+        node.loop.run_until_complete(node.subscribe_async("/topic", local, executor="process"))
+
+    assert calls == []
+    assert node.process_pool is None and node.executors == {}
+
+
+def test_intra_process(node, monkeypatch):
+    add_publishers(node, "/topic", String, 1)
+    node.addr = ("localhost", 1)
+    monkeypatch.setitem(_LOCAL_NODES, node.uri, node)
+
+    sub = Node("/sub")
+    sub.addr = ("localhost", 2)
+    received = []
+
+    def callback(msg: String):
+        received.append(msg)
+
+    async def master(uri, method, *args):
+        return 1, "OK", [node.uri]
+
+    monkeypatch.setattr(sub, "_rpc", master)
+    sub.subscribe("/topic", callback)
+    sub.loop.run_until_complete(asyncio.sleep(0.01))
+
+    s = String()
+    s.data = "foo"
+    node.publish("/topic", s)
+
+    assert received == [s]
+    # remote subscribers still get the serialized message
+    assert node.pubs["/topic"]["/sub0"].transport.data == frame(s)
+
+    sub.subs["/topic"][node.uri].transport.close()
+    node.publish("/topic", s)
+    assert received == [s]
+
+
+def test_intra_process_arrays():
+    received = []
+
+    def callback(msg: ChannelFloat32):
+        received.append(msg.values)
+
+    async def main():
+        async with Master() as master, Node("/pub", master.uri) as pub, Node("/sub", master.uri) as sub:
+            await pub.announce_async("/values", ChannelFloat32)
+            # the decode options need the serialized message, even if the publisher is in the same process
+            await sub.subscribe_async("/values", callback, arrays=True)
+            while not pub.pubs["/values"]:
+                await asyncio.sleep(0.01)
+
+            c = ChannelFloat32()
+            c.values = [1.5, 2.5]
+            pub.publish("/values", c)
+            while not received:
+                await asyncio.sleep(0.01)
+
+            assert not pub.local_subs["/values"]
+
+    asyncio.get_event_loop().run_until_complete(main())
+    assert not isinstance(received[0], list)
+    assert list(received[0]) == [1.5, 2.5]
+
+
+def test_schedule_publish_pauses(node):
+    add_publishers(node, "/topic", String, 0)
+    calls = []
+
+    def factory(last: Optional[String]) -> String:
+        s = String()
+        s.data = str(len(calls))
+        calls.append(last)
+        return s
+
+    node.schedule_publish("/topic", 200, factory)
+    node.loop.run_until_complete(asyncio.sleep(0.05))
+    assert calls == []
+
+    server = node._tcpros_server()
+    server.connection_made(FakeTransport())
+    server.data_received(converter.encode_header(String, "/sub", "/topic"))
+    node.loop.run_until_complete(asyncio.sleep(0.05))
+    assert len(calls) >= 5
+    assert calls[0] is None and calls[2].data == "1"
+
+    server.connection_lost(None)
+    node.loop.run_until_complete(asyncio.sleep(0.01))
+    n = len(calls)
+    node.loop.run_until_complete(asyncio.sleep(0.05))
+    assert len(calls) == n
+    node.scheduler.close()
+
+
+def test_latch():
+    received = []
+
+    def callback(msg: String):
+        received.append(msg.data)
+
+    async def main():
+        async with Master() as master, Node("/map_server", master.uri) as pub:
+            await pub.announce_async("/map", String, latch=True)
+            s = String()
+            s.data = "first"
+            pub.publish("/map", s)
+            s.data = "map"
+            pub.publish("/map", s)
+
+            # late subscribers get the last message right after connecting, over TCPROS and in the same process
+            async with Node("/remote", master.uri) as remote, Node("/local", master.uri) as local:
+                await remote.subscribe_async("/map", callback, intra_process=False)
+                await local.subscribe_async("/map", callback)
+                while len(received) < 2:
+                    await asyncio.sleep(0.01)
+
+                assert received == ["map", "map"]
+                protocol = next(iter(remote.subs["/map"].values())).protocol
+                assert protocol.headers["latching"] == "1"
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+
+
+@fixture
+def thread_master():
+    # a master in another thread can answer the blocking calls of the sync API
+    loop = asyncio.new_event_loop()
+    master = Master(loop=loop)
+    loop.run_until_complete(master.open_async())
+    thread = Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield master
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(master.close_async())
+    loop.close()
+
+
+def test_sync_in_callback(thread_master):
+    received = []
+
+    def callback(msg: String):
+        received.append(msg.data)
+
+    async def main():
+        async with Node("/talker", thread_master.uri) as pub, Node("/listener", thread_master.uri) as sub:
+            await pub.announce_async("/chatter", String)
+
+            # the connection to the publisher in the same loop is set up in the background without blocking calls
+            sub.loop.call_soon(lambda: sub.subscribe("/chatter", callback, intra_process=False))
+            while not pub.pubs["/chatter"]:
+                await asyncio.sleep(0.01)
+            s = String()
+            s.data = "hello"
+            pub.publish("/chatter", s)
+            while not received:
+                await asyncio.sleep(0.01)
+
+    asyncio.get_event_loop().run_until_complete(main())
+    assert received == ["hello"]
+
+
+def test_exit_in_callback(thread_master):
+    loop = asyncio.get_event_loop()
+    n = Node("/exit", thread_master.uri)
+    n.__enter__()
+    n.announce("/chatter", String)
+    errors = []
+
+    def close():
+        try:
+            n.__exit__(None, None, None)
+        except Exception as e:
+            errors.append(e)
+
+    loop.call_soon(close)
+    loop.run_forever()
+    # lets the session close
+    loop.run_until_complete(asyncio.sleep(0))
+
+    assert errors == []
+    assert thread_master.publishers.get("/chatter", {}) == {}
+
+
+def test_sync_in_callback_same_loop():
+    errors = []
+
+    def callback(msg: String):
+        pass
+
+    async def main():
+        async with Master() as master, Node("/listener", master.uri) as n:
+            def subscribe():
+                try:
+                    n.subscribe("/chatter", callback)
+                except RuntimeError as e:
+                    errors.append(str(e))
+
+            n.loop.call_soon(subscribe)
+            await asyncio.sleep(0.01)
+
+    asyncio.get_event_loop().run_until_complete(main())
+    assert len(errors) == 1 and "registerSubscriber" in errors[0] and "_async" in errors[0]
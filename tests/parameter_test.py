@@ -0,0 +1,117 @@
+import asyncio
+from alpyro.master import Master
+from alpyro.node import Node
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def count_calls(node):
+    calls = []
+    rpc = node._rpc
+
+    async def counting(uri, method, *args):
+        calls.append(method)
+        return await rpc(uri, method, *args)
+
+    node._rpc = counting
+    return calls
+
+
+async def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    assert condition()
+
+
+def test_unknown_param_update():
+    node = Node("/ns/node")
+    run(node.paramUpdate("/master", "/not/subscribed", 1))
+
+    node.param.subscribed["/ns"] = {"a": 1, "b": {"c": 2}}
+    updates = []
+    node.param_callbacks["/ns"] = updates.append
+
+    run(node.paramUpdate("/master", "/ns/b/c", 3))
+    run(node.paramUpdate("/master", "/ns/b/d", 4))
+    assert node.param["b"] == {"c": 3, "d": 4}
+    assert node.param["~missing"] is None
+    assert "a" in node.param and "b/e" not in node.param
+    assert updates == [{"a": 1, "b": {"c": 3}}, {"a": 1, "b": {"c": 3, "d": 4}}]
+
+    run(node.paramUpdate("/master", "/", {"ns": {"x": 5}}))
+    assert node.param.subscribed["/ns"] == {"x": 5}
+
+
+def test_param_update_trailing_slash():
+    node = Node("/node")
+    node.param.subscribed["/a/b"] = 1
+    node.param.subscribed["/ns"] = {"x": 1}
+    updates = []
+    node.param_callbacks["/a/b"] = updates.append
+
+    run(node.paramUpdate("/master", "/a/b/", 5))
+    run(node.paramUpdate("/master", "/ns/x/", 2))
+
+    assert updates == [5]
+    assert node.param.subscribed == {"/a/b": 5, "/ns": {"x": 2}}
+    assert node.param["/ns/x"] == 2
+
+
+def test_prefetch():
+    async def main():
+        async with Master() as master, Node("/robot/controller", master.uri) as node, Node("/tuner", master.uri) as tuner:
+            await tuner.param.set_async("/robot/gains", {"p": 1.0, "i": 0.1})
+            await node.param.prefetch_async("/robot")
+            calls = count_calls(node)
+
+            assert await node.param.get_async("gains/p") == 1.0
+            assert node.param["/robot/gains"] == {"p": 1.0, "i": 0.1}
+            assert "gains/d" not in node.param
+            assert calls == []
+
+            # changes of other nodes arrive with paramUpdate
+            await tuner.param.set_async("/robot/gains/p", 2.0)
+            await wait_for(lambda: node.param["gains/p"] == 2.0)
+            await tuner.param.delete_async("/robot/gains/i")
+            await wait_for(lambda: node.param["gains/i"] is None)
+
+            # own changes are visible immediately
+            await node.param.set_async("gains/d", 0.5)
+            assert node.param["gains"] == {"p": 2.0, "d": 0.5}
+            assert calls == ["setParam"]
+
+    run(main())
+
+
+def test_cache():
+    async def main():
+        async with Master() as master, Node("/node", master.uri) as node:
+            node.param.enable_cache(ttl=0.1, max_size=2)
+            await node.param.set_async("a", 1)
+            await node.param.set_async("b", 2)
+            calls = count_calls(node)
+
+            assert await node.param.get_async("a") == 1
+            assert await node.param.get_async("a") == 1
+            assert await node.param.get_async("missing") is None
+            assert await node.param.get_async("missing") is None
+            assert calls == ["getParam", "getParam"]
+
+            # the least recently used key is evicted
+            assert await node.param.get_async("b") == 2
+            assert await node.param.get_async("a") == 1
+            assert calls == ["getParam", "getParam", "getParam", "getParam"]
+
+            # writes invalidate, other nodes' writes are seen after the ttl
+            await node.param.set_async("b", 3)
+            assert await node.param.get_async("b") == 3
+            await master.setParam("/other", "/b", 4)
+            assert await node.param.get_async("b") == 3
+            await asyncio.sleep(0.15)
+            assert await node.param.get_async("b") == 4
+
+    run(main())
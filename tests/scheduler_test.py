@@ -0,0 +1,80 @@
+import asyncio
+import time
+from alpyro.scheduler import Scheduler
+
+
+def test_no_drift():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+    ticks = []
+
+    def slow():
+        ticks.append(loop.time())
+        time.sleep(0.002)
+
+    call = scheduler.add("/fast", 0.005, slow)
+    loop.run_until_complete(asyncio.sleep(0.5))
+    scheduler.close()
+    loop.close()
+
+    # sleeping for the period after each call would only reach 70 calls
+    assert len(ticks) >= 85
+    assert len(ticks) + call.overruns >= 95
+
+
+def test_overruns():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+
+    call = scheduler.add("/slow", 0.01, lambda: time.sleep(0.025))
+    loop.run_until_complete(asyncio.sleep(0.2))
+    scheduler.close()
+    loop.close()
+
+    # every call takes more than two periods, the calls and skipped periods together keep the rate
+    assert call.overruns >= call.calls
+    assert call.calls * 0.025 <= (call.calls + call.overruns) * 0.01 + 0.025
+
+
+def test_batching():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+    timers = []
+    tick = scheduler._tick
+    scheduler._tick = lambda: timers.append(1) or tick()
+
+    a = scheduler.add("a", 0.01, lambda: None)
+    b = scheduler.add("b", 0.02, lambda: None)
+    loop.run_until_complete(asyncio.sleep(0.1))
+    scheduler.close()
+    loop.close()
+
+    # every call of b happens in the same tick as a call of a
+    assert b.calls >= 3
+    assert len(timers) == a.calls
+
+
+def test_pause():
+    loop = asyncio.new_event_loop()
+    scheduler = Scheduler(loop)
+    subscribers = []
+    calls = []
+
+    call = scheduler.add("/topic", 0.005, lambda: calls.append(1), lambda: bool(subscribers))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert call.paused and not calls
+    assert scheduler._timer is None
+
+    subscribers.append("/sub")
+    scheduler.resume("/topic")
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert len(calls) >= 5
+
+    subscribers.clear()
+    loop.run_until_complete(asyncio.sleep(0.02))
+    n = len(calls)
+    loop.run_until_complete(asyncio.sleep(0.05))
+    assert call.paused and len(calls) == n
+
+    scheduler.close()
+    loop.close()
@@ -0,0 +1,317 @@
+import asyncio
+from alpyro_msgs.std_msgs.header import Header
+from alpyro_msgs.std_msgs.string import String
+from alpyro_msgs.sensor_msgs.image import Image
+from alpyro.shm import ShmReader, ShmWriter
+from alpyro.tcp import FrameReader, TCPROSClient, TCPROSConverter, TCPROSServer, _CHUNK_SIZE
+
+converter = TCPROSConverter()
+
+
+class FakeTransport:
+    def __init__(self):
+        self.data = bytearray()
+        self.closed = False
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.data.extend(data)
+
+    def writelines(self, data):
+        self.write(b"".join(data))
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+
+def frame(msg):
+    data = converter.encode(msg)
+    return len(data).to_bytes(4, "little") + data
+
+
+def feed(protocol, data, chunk_size):
+    data = memoryview(data)
+    while data:
+        buffer = protocol.get_buffer(-1)
+        n = min(len(buffer), len(data), chunk_size)
+        buffer[:n] = data[:n]
+        protocol.buffer_updated(n)
+        data = data[n:]
+
+
+def make_client(typ, **kwargs):
+    received = []
+
+    def callback(msg):
+        received.append(msg)
+
+    client = TCPROSClient(callback, typ, "/sub", "/topic", "msg", "", None, **kwargs)
+    client.connection_made(FakeTransport())
+    header = converter.encode_header(typ, "/pub", "/topic")
+    return client, header, received
+
+
+def strings(n):
+    msgs = []
+    for i in range(n):
+        s = String()
+        s.data = f"message {i}"
+        msgs.append(s)
+    return msgs
+
+
+def test_many_frames_in_one_chunk():
+    client, header, received = make_client(String)
+    msgs = strings(5000)
+
+    feed(client, header + b"".join(frame(m) for m in msgs), 1 << 20)
+
+    assert [m.data for m in received] == [m.data for m in msgs]
+
+
+def test_split_frames():
+    client, header, received = make_client(String)
+    msgs = strings(50)
+
+    feed(client, header + b"".join(frame(m) for m in msgs), 3)
+
+    assert [m.data for m in received] == [m.data for m in msgs]
+
+
+def test_large_frames():
+    client, header, received = make_client(Image)
+    msgs = []
+    for i in range(3):
+        img = Image()
+        img.header = Header()
+        img.header.seq = i
+        img.data = bytes([i]) * (3 * _CHUNK_SIZE + i)
+        msgs.append(img)
+
+    feed(client, header + b"".join(frame(m) for m in msgs), 1000)
+
+    assert [m.header.seq for m in received] == [0, 1, 2]
+    assert [m.data for m in received] == [m.data for m in msgs]
+    assert all(isinstance(m.data, bytes) for m in received)
+
+
+def test_views():
+    client, header, received = make_client(Image, views=True)
+    small = Image()
+    small.data = b"small"
+    large = Image()
+    large.data = b"l" * (2 * _CHUNK_SIZE)
+
+    feed(client, header + frame(small) + frame(large) + frame(small), 4096)
+
+    assert [bytes(m.data) for m in received] == [small.data, large.data, small.data]
+    assert all(isinstance(m.data, memoryview) for m in received)
+
+
+def test_lazy():
+    client, header, received = make_client(String, lazy=True)
+    msgs = strings(3)
+
+    feed(client, header + b"".join(frame(m) for m in msgs), 7)
+
+    assert "data" not in received[0].__dict__
+    assert [m.data for m in received] == [m.data for m in msgs]
+
+
+def test_reuse():
+    client, header, received = make_client(String, reuse=True)
+    msgs = strings(3)
+    data = []
+
+    client.callback = lambda msg: data.append(msg.data) or received.append(msg)
+    feed(client, header + b"".join(frame(m) for m in msgs), 7)
+
+    assert data == [m.data for m in msgs]
+    assert all(m is client.msg for m in received)
+
+
+def test_encode_frame():
+    s = String()
+    s.data = "foo"
+
+    assert converter.encode_frame(s) == frame(s)
+    assert converter.frame(bytes(converter.encode(s))) == frame(s)
+
+
+def make_server(typ, topic="/topic", callerid="/sub", shm_writer=None, extra=None, **options):
+    connections = []
+
+    def lookup(t):
+        return (typ, options) if t == "/topic" else None
+
+    server = TCPROSServer("/pub", lookup, connections.append, connections.remove, shm_writer)
+    server.connection_made(FakeTransport())
+    server.data_received(converter.encode_header(typ, callerid, topic, extra=extra))
+    return server, connections
+
+
+def test_server_handshake():
+    server, connections = make_server(String)
+
+    assert connections == [server]
+    assert server.send_data
+    assert converter.decode_header(server.transport.data[4:])["type"] == String.__msg_typ__
+
+    server.connection_lost(None)
+    assert connections == []
+
+
+def test_server_split_header():
+    connections = []
+    server = TCPROSServer("/pub", lambda t: (String, {}), connections.append, connections.remove)
+    server.connection_made(FakeTransport())
+
+    header = converter.encode_header(String, "/sub", "/topic")
+    for i in range(len(header)):
+        server.data_received(header[i : i + 1])
+
+    assert connections == [server]
+    assert server.callerid == "/sub"
+
+
+def test_frame_reader_feed():
+    frames = []
+    reader = FrameReader(lambda f: frames.append(bytes(f)))
+    data = b"".join(len(m).to_bytes(4, "little") + m for m in (b"a", b"", b"bc" * 50000, b"d"))
+
+    # the length prefixes are split, the chunks contain several frames and a frame larger than the buffer
+    for i in range(0, len(data), 3):
+        reader.feed(data[i : i + 3])
+    reader.feed(data)
+
+    assert frames == [b"a", b"", b"bc" * 50000, b"d"] * 2
+
+
+def test_server_unknown_topic():
+    server, connections = make_server(String, topic="/other")
+
+    assert connections == []
+    assert not server.send_data
+    assert "error" in converter.decode_header(server.transport.data[4:])
+    assert server.transport.closed
+
+
+def test_queue_drops_oldest():
+    server, _ = make_server(String, queue_size=2)
+    server.transport.data.clear()
+    msgs = strings(5)
+
+    server.pause_writing()
+    for m in msgs:
+        server.publish(m)
+
+    assert server.transport.data == b""
+    assert server.dropped == 3
+
+    server.resume_writing()
+    assert server.transport.data == frame(msgs[3]) + frame(msgs[4])
+
+
+def test_coalesce():
+    msgs = strings(100)
+
+    async def publish(coalesce_us):
+        server, _ = make_server(String, coalesce_us=coalesce_us)
+        server.transport.data.clear()
+        server.transport.writes = 0
+
+        for m in msgs:
+            server.publish(m)
+        assert server.transport.writes == 0
+
+        await asyncio.sleep(0.01)
+        assert server.transport.writes == 1
+        assert server.transport.data == b"".join(frame(m) for m in msgs)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(publish(0))
+    loop.run_until_complete(publish(2000))
+    loop.close()
+
+
+def test_coalesce_paused_order():
+    msgs = strings(4)
+
+    async def publish(resume_before_flush):
+        server, _ = make_server(String, coalesce_us=2000)
+        server.transport.data.clear()
+
+        server.publish(msgs[0])
+        server.publish(msgs[1])
+        server.pause_writing()
+        server.publish(msgs[2])
+        if resume_before_flush:
+            server.resume_writing()
+        else:
+            await asyncio.sleep(0.01)
+            server.resume_writing()
+        server.publish(msgs[3])
+
+        await asyncio.sleep(0.01)
+        assert server.transport.data == b"".join(frame(m) for m in msgs)
+
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(publish(True))
+    loop.run_until_complete(publish(False))
+    loop.close()
+
+
+def test_shm_ring():
+    writer = ShmWriter(256)
+    reader = ShmReader(writer.name)
+    try:
+        first = frame(strings(1)[0])
+        notification = writer.write(first)
+        assert writer.write(first) is notification
+
+        data, pos = reader.read(memoryview(notification)[4:])
+        assert bytes(data) == first[4:]
+        assert reader.valid(pos)
+
+        # the ring wraps around and overwrites the first message
+        for m in strings(20):
+            writer.write(frame(m))
+        assert not reader.valid(pos)
+
+        large = String()
+        large.data = "x" * 200
+        data, pos = reader.read(memoryview(writer.write(frame(large)))[4:])
+        assert bytes(data) == frame(large)[4:]
+        assert pos == -1
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_shm_connection():
+    writer = ShmWriter(1 << 16)
+    server, _ = make_server(String, shm_writer=lambda topic: writer, extra={"shm": "1"})
+    client, _, received = make_client(String, shm=True)
+    try:
+        reply = bytes(server.transport.data)
+        server.transport.data.clear()
+        msgs = strings(10)
+        for m in msgs:
+            server.publish(m)
+
+        # only notifications with the position of the message in the ring are sent
+        assert len(server.transport.data) == len(msgs) * 25
+        feed(client, reply + server.transport.data, 5)
+
+        assert [m.data for m in received] == [m.data for m in msgs]
+        assert client.shm.dropped == 0
+    finally:
+        client.connection_lost(None)
+        writer.close()
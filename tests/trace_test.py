@@ -0,0 +1,62 @@
+import asyncio
+import json
+from alpyro_msgs.std_msgs.string import String
+from alpyro import trace
+from alpyro.master import Master
+from alpyro.node import Node
+from alpyro.trace import CallbackTracer, ChromeTrace, Histogram
+
+
+def test_events():
+    events = []
+    received = []
+
+    def callback(msg: String):
+        received.append(msg.data)
+
+    async def main():
+        async with Master() as master, Node("/talker", master.uri) as pub, Node("/listener", master.uri) as sub:
+            await pub.announce_async("/chatter", String)
+            await sub.subscribe_async("/chatter", callback, intra_process=False)
+            while not pub.pubs["/chatter"]:
+                await asyncio.sleep(0.01)
+
+            s = String()
+            s.data = "hello"
+            with trace.tracing(CallbackTracer(lambda *e: events.append(e))):
+                pub.publish("/chatter", s)
+                while not received:
+                    await asyncio.sleep(0.01)
+
+    asyncio.get_event_loop().run_until_complete(main())
+
+    assert trace.tracer is None
+    names = [name for name, topic, start, end, size in events]
+    assert names == ["encode", "write", "receive", "frame", "decode", "callback"]
+    assert all(topic == "/chatter" and start <= end for _, topic, start, end, _ in events)
+    assert events[1][4] == 13
+
+
+def test_histogram():
+    h = Histogram()
+    for d in range(1, 101):
+        h.event("decode", "/t", 1000, 1000 + d * 10)
+
+    assert h.percentile("decode", "/t", 0.5) == 511
+    assert h.percentile("decode", "/t", 0.99) == 1023
+    summary = h.summary()["/t"]["decode"]
+    assert summary["count"] == 100
+    assert summary["mean_us"] == 0.505
+
+
+def test_chrome_trace(tmp_path):
+    t = ChromeTrace(max_events=2)
+    t.event("decode", "/t", 1000, 3000, 8)
+    t.event("receive", "/t", 4000, 4000, 12)
+    t.event("callback", "/t", 5000, 6000)
+    t.save(str(tmp_path / "trace.json"))
+
+    with open(tmp_path / "trace.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [(e["name"], e["ph"], e["ts"]) for e in events] == [("decode", "X", 1.0), ("receive", "i", 4.0)]
+    assert events[0]["dur"] == 2.0 and events[0]["args"] == {"size": 8}
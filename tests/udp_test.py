@@ -0,0 +1,123 @@
+import asyncio
+from alpyro_msgs.std_msgs.string import String
+from alpyro.master import Master
+from alpyro.node import Node
+from alpyro.udp import DATA0, DATAN, UDPROSClient, UDPROSServer, _HEADER
+from tests.tcp_test import converter, frame
+
+
+class FakeDatagramTransport:
+    def __init__(self):
+        self.datagrams = []
+        self.closed = False
+
+    def sendto(self, data, addr=None):
+        self.datagrams.append(bytes(data))
+
+    def close(self):
+        self.closed = True
+
+
+def make_server(max_datagram_size=100):
+    server = UDPROSServer("/topic", "/sub", max_datagram_size, lambda ps: None)
+    server.connection_made(FakeDatagramTransport())
+    return server
+
+
+def make_client(conn_id):
+    received = []
+
+    def callback(msg: String):
+        received.append(msg.data)
+
+    client = UDPROSClient(callback, String, "/sub", "/topic", "msg", "", None)
+    client.connection_made(FakeDatagramTransport())
+    client.accept(conn_id, converter.encode_header(String, "/pub", "/topic")[4:])
+    return client, received
+
+
+def string(data):
+    s = String()
+    s.data = data
+    return s
+
+
+def test_fragments():
+    server = make_server()
+    server.publish_frame(frame(string("x" * 250)))
+    server.publish_frame(frame(string("small")))
+
+    datagrams = server.transport.datagrams
+    assert len(datagrams) == 4
+    assert all(len(d) <= 100 for d in datagrams)
+    assert _HEADER.unpack_from(datagrams[0]) == (server.id, DATA0, 1, 3)
+    assert _HEADER.unpack_from(datagrams[2]) == (server.id, DATAN, 1, 2)
+    assert _HEADER.unpack_from(datagrams[3]) == (server.id, DATA0, 2, 1)
+
+    client, received = make_client(server.id)
+    for d in datagrams:
+        client.datagram_received(d, None)
+
+    assert received == ["x" * 250, "small"]
+    assert client.stats.messages == 2
+    assert client.dropped == 0
+
+
+def test_drop_incomplete():
+    server = make_server()
+    for data in ("a" * 200, "b" * 200, "c" * 200):
+        server.publish_frame(frame(string(data)))
+    first, second, third = [server.transport.datagrams[i : i + 3] for i in (0, 3, 6)]
+
+    client, received = make_client(server.id)
+    # a lost block, blocks out of order and datagrams of another connection
+    for d in first[:1] + first[2:] + second[:1] + second[2:] + second[1:2] + third:
+        client.datagram_received(d, None)
+    client.datagram_received(_HEADER.pack(server.id + 1, DATA0, 9, 1) + frame(string("other")), None)
+
+    assert received == ["c" * 200]
+    assert client.dropped == 2
+
+
+def test_early_datagrams():
+    server = make_server()
+    server.publish_frame(frame(string("latched")))
+
+    received = []
+
+    def callback(msg: String):
+        received.append(msg.data)
+
+    client = UDPROSClient(callback, String, "/sub", "/topic", "msg", "", None)
+    client.connection_made(FakeDatagramTransport())
+    # the message of a latched topic can arrive before the answer to requestTopic
+    client.datagram_received(server.transport.datagrams[0], None)
+    assert received == []
+
+    client.accept(server.id, converter.encode_header(String, "/pub", "/topic")[4:])
+    assert received == ["latched"]
+
+
+def test_udpros():
+    received = []
+
+    def callback(msg: String):
+        received.append(msg.data)
+
+    async def main():
+        async with Master() as master, Node("/talker", master.uri) as pub, Node("/listener", master.uri) as sub:
+            await pub.announce_async("/chatter", String)
+            await sub.subscribe_async("/chatter", callback, intra_process=False, udp=True)
+            while not pub.pubs["/chatter"]:
+                await asyncio.sleep(0.01)
+
+            for data in ("hello", "x" * 5000):
+                pub.publish("/chatter", string(data))
+            while len(received) < 2:
+                await asyncio.sleep(0.01)
+
+            assert received == ["hello", "x" * 5000]
+            assert pub.stats()["publications"]["/chatter"]["connections"][0]["transport"] == "UDPROS"
+            assert sub.stats()["subscriptions"]["/chatter"]["connections"][0]["transport"] == "UDPROS"
+
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime
+from xmlrpc.client import APPLICATION_ERROR, METHOD_NOT_FOUND, PARSE_ERROR, Fault
+from alpyro.xmlrpc import XMLRPCClient, XMLRPCServer, load
+from pytest import fixture, raises
+
+
+class EchoServer(XMLRPCServer):
+    async def echo(self, caller_id, value):
+        return 1, caller_id, value
+
+    def count(self, caller_id):
+        return 1, "OK", 42
+
+    async def fail(self, caller_id):
+        raise KeyError(caller_id)
+
+
+@fixture
+def server():
+    loop = asyncio.new_event_loop()
+    server = EchoServer(loop)
+    server.create_server()
+    yield server
+    server.loop_server.close()
+    loop.close()
+
+
+def call(server, client, method, *args):
+    _, port = server.addr
+    proxy = client.proxy(f"http://127.0.0.1:{port}")
+    return server.loop.run_until_complete(getattr(proxy, method)(*args))
+
+
+def test_client(server):
+    client = XMLRPCClient()
+
+    assert call(server, client, "echo", "/caller", [1, "two"]) == (1, "/caller", [1, "two"])
+    assert call(server, client, "count", "/caller") == (1, "OK", 42)
+    assert call(server, client, "echo", "", {"a": 0.5, "b": [True, ""]}) == (1, "", {"a": 0.5, "b": [True, ""]})
+
+    server.loop.run_until_complete(client.close())
+
+
+def test_types(server):
+    client = XMLRPCClient()
+    values = [None, 2**40, -1.5, False, b"\x00\xff", datetime(2020, 1, 2, 3, 4, 5), {"nested": [{"a": [1]}]}, "<&>"]
+
+    assert call(server, client, "echo", "/caller", values) == (1, "/caller", values)
+
+    # a value without a type is a string
+    _, port = server.addr
+    body = b"<methodCall><methodName>echo</methodName><params><param><value>/caller</value></param>" \
+        b"<param><value><i4>1</i4></value></param></params></methodCall>"
+
+    async def post():
+        async with client.session.post(f"http://127.0.0.1:{port}", data=body) as response:
+            return await response.text()
+
+    assert "<string>/caller</string>" in server.loop.run_until_complete(post())
+    server.loop.run_until_complete(client.close())
+
+
+def test_faults(server):
+    client = XMLRPCClient()
+
+    with raises(Fault) as e:
+        call(server, client, "unknown", "/caller")
+    assert e.value.faultCode == METHOD_NOT_FOUND
+
+    with raises(Fault) as e:
+        call(server, client, "_method", "/caller")
+    assert e.value.faultCode == METHOD_NOT_FOUND
+
+    with raises(Fault) as e:
+        call(server, client, "fail", "/caller")
+    assert e.value.faultCode == APPLICATION_ERROR
+    assert "KeyError" in e.value.faultString
+
+    _, port = server.addr
+
+    async def post():
+        async with client.session.post(f"http://127.0.0.1:{port}", data=b"<methodCall>") as response:
+            return await response.read()
+
+    with raises(Fault) as e:
+        load(server.loop.run_until_complete(post()))
+    assert e.value.faultCode == PARSE_ERROR
+
+    server.loop.run_until_complete(client.close())